@@ -0,0 +1,142 @@
+"""
+The batch runs the router over a directory, or glob, of input files in a
+pool of worker processes writing one output file per input file.  With
+converters the files are instead run thru the pipeline which converts them
+in threads while the worker processes parse.
+"""
+import os
+import sys
+import glob
+import time
+
+from multiprocessing import Pool, cpu_count
+
+from router   import Router
+from pipeline import Pipeline
+
+########################################################################
+def _route(args):
+    """
+    Process pool worker for Batch.run() that runs one input file thru
+    the router.
+
+    @param  tuple  args  The input path, output path and router options
+    @return  tuple  The input path, question count, seconds and error
+    """
+    inputpath, outputpath, options = args
+    start = time.time()
+    try:
+        router = Router()
+        router.start(['-i', inputpath, '-o', outputpath] + options)
+        router.options.outputfile.close()
+        return inputpath, len(router.questions), time.time() - start, None
+
+    except Exception:
+        return inputpath, 0, time.time() - start, str(sys.exc_info()[1])
+
+########################################################################
+class Batch(object):
+    """
+    The batch collects the input files and spreads them over the worker
+    processes, largest first so that one big PDF started last does not
+    extend the total run time.
+
+    >>> b = Batch('input', ['-w', 'JsonWriter'], outdir='output')
+    >>> b.outputpath('input/teachers.pdf')
+    'output/teachers.choice.json'
+    >>> b.inputs()[0]
+    'input/accounting.txt'
+    """
+    suffix = '.choice'
+
+    def __init__(self, pattern, options=(), workers=None, outdir=None, converters=None):
+        self.pattern = pattern
+        # the workers are daemonic and so cannot have process pools of
+        # their own, the files are run in parallel instead
+        self.options = list(options) + ['--jobs', '0', '--pdf-jobs', '0']
+        self.workers = workers or cpu_count()
+        self.outdir  = outdir
+        self.converters = converters
+        self.results = []
+
+        # ask the router which writer, and so which extension, we use
+        router = Router()
+        router.setup(self.options)
+        self.extension = router._get_writer().extension or '.txt'
+
+    def inputs(self):
+        """
+        The input files, skipping our own output files, largest first.
+
+        @return  list  The input file paths
+        """
+        if os.path.isdir(self.pattern):
+            paths = [os.path.join(self.pattern, name) for name in os.listdir(self.pattern)]
+        else:
+            paths = glob.glob(self.pattern)
+
+        paths = [p for p in paths if os.path.isfile(p) and self.suffix + '.' not in os.path.basename(p)]
+
+        return sorted(paths, key=lambda p: (-os.path.getsize(p), p))
+
+    def outputpath(self, inputpath):
+        """
+        The output file for an input file, next to it or in the outdir.
+
+        @param  string  inputpath  The input file path
+        @return  string  The output file path
+        """
+        directory, name = os.path.split(inputpath)
+        name = os.path.splitext(name)[0] + self.suffix + self.extension
+
+        return os.path.join(self.outdir if self.outdir else directory, name)
+
+    def run(self, inputpaths=None):
+        """
+        Run all the input files, or just the given ones, thru the router in
+        the worker pool.
+
+        @param  list  inputpaths  The input file paths, def=inputs()
+        @return  list  The (input path, question count, seconds, error) results
+        """
+        if inputpaths is None:
+            inputpaths = self.inputs()
+
+        tasks = [(p, self.outputpath(p), self.options) for p in inputpaths]
+        if not tasks:
+            self.results = []
+            return self.results
+
+        if self.outdir and not os.path.isdir(self.outdir):
+            os.makedirs(self.outdir)
+
+        if self.converters:
+            return self._pipeline([t[0] for t in tasks])
+
+        pool = Pool(self.workers)
+        try:
+            # chunksize 1 keeps the largest-first order across the workers
+            self.results = list(pool.imap_unordered(_route, tasks, 1))
+        finally:
+            pool.close()
+            pool.join()
+
+        return self.results
+
+    def _pipeline(self, inputpaths):
+        """
+        Run the input files thru the pipeline writing each output file as
+        soon as its input is parsed.
+
+        @param  list  inputpaths  The input file paths
+        @return  list  The (input path, question count, seconds, error) results
+        """
+        self.results = []
+        pipeline = Pipeline(self.options, self.converters, self.workers)
+        for inputpath, output, count, seconds, error in pipeline.run(inputpaths):
+            if output is not None:
+                with open(self.outputpath(inputpath), 'wb') as outputfile:
+                    outputfile.write(output)
+            self.results.append((inputpath, count, seconds, error))
+
+        return self.results
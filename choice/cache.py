@@ -0,0 +1,405 @@
+"""
+The cache keeps converted input on disk, keyed by the content of the input
+file and the converter command line, so that an unchanged PDF does not have
+to be converted again.
+
+The result cache keeps the questions and writer output of whole router runs
+in memory and on disk, keyed by the input text and the router configuration,
+so that a document sent again with the same options is not parsed again.
+Its disk entries are signed with a key only readable by the owner of the
+cache directory, and an entry that does not check out is a miss.
+"""
+import os
+import hmac
+import glob
+import errno
+import hashlib
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+########################################################################
+class Cache(object):
+    """
+    The cache stores one file per key in its directory and keeps the total
+    size under the limit by evicting the least recently used entries, the
+    modification time of an entry being updated each time it is read.
+
+    >>> import shutil
+    >>> d = tempfile.mkdtemp()
+    >>> c = Cache(d, 10)
+    >>> c.get('k1') is None
+    True
+    >>> c.put('k1', 'ABCDEF')
+    >>> c.get('k1')
+    'ABCDEF'
+    >>> c.put('k2', 'GHIJKL')
+    >>> c.get('k1'), c.get('k2')
+    (None, 'GHIJKL')
+    >>> shutil.rmtree(d)
+    """
+    extension = '.txt'
+
+    def __init__(self, directory, limit, extension=None):
+        self.directory = directory
+        self.limit     = limit
+        if extension:
+            self.extension = extension
+
+    def key(self, inputpath, command_line):
+        """
+        The key for an input file converted by a command line, which should
+        not include the input file name so that a moved file still hits.
+
+        @param  string  inputpath  The input file path
+        @param  list  command_line  The converter arguments
+        @return  string  The hex digest key
+
+        >>> f = tempfile.NamedTemporaryFile()
+        >>> f.write('%PDF'); f.flush()
+        >>> c = Cache(None, 0)
+        >>> c.key(f.name, ['pdftotext', '-raw']) == c.key(f.name, ['pdftotext', '-raw'])
+        True
+        >>> c.key(f.name, ['pdftotext', '-raw']) == c.key(f.name, ['pdftotext'])
+        False
+        """
+        digest = hashlib.sha1('\0'.join(command_line) + '\0')
+        with open(inputpath, 'rb') as inputfile:
+            for block in iter(lambda: inputfile.read(1 << 20), ''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        @param  string  key  The entry key
+        @return  string  The cached contents, None on a miss
+        """
+        cachefile = self.open(key)
+        if cachefile is None:
+            return None
+
+        with cachefile:
+            return cachefile.read()
+
+    def open(self, key):
+        """
+        Open the entry to be read a bit at a time.
+
+        @param  string  key  The entry key
+        @return  file  The open cache file, None on a miss
+        """
+        entry = self._path(key)
+        try:
+            cachefile = open(entry, 'rb')
+            os.utime(entry, None)
+            return cachefile
+
+        except (IOError, OSError):
+            return None
+
+    def put(self, key, contents):
+        """
+        Store the contents and evict.
+
+        @param  string  key  The entry key
+        @param  string  contents  The converted contents
+        """
+        if len(contents) > self.limit:
+            return
+
+        cachefile = self.create()
+        with cachefile:
+            cachefile.write(contents)
+        self.commit(key, cachefile)
+
+    def create(self):
+        """
+        Create a temporary file for an entry that is written a bit at a
+        time, so that a concurrent reader never sees a partial entry.
+
+        @return  file  The open temporary file
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        return tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+
+    def commit(self, key, cachefile):
+        """
+        Move a written temporary file into place as the entry and evict,
+        or just remove it if it is over the limit.
+
+        @param  string  key  The entry key
+        @param  file  cachefile  The closed temporary file from create()
+        """
+        if os.path.getsize(cachefile.name) > self.limit:
+            os.remove(cachefile.name)
+            return
+
+        os.rename(cachefile.name, self._path(key))
+        self._evict()
+
+    def discard(self, cachefile):
+        """
+        Remove a temporary file from create() that is not to be committed.
+
+        @param  file  cachefile  The temporary file
+        """
+        cachefile.close()
+        try:
+            os.remove(cachefile.name)
+        except OSError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.extension):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError: # evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        # oldest first until we fit
+        total = sum(e[1] for e in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.limit:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+########################################################################
+class MemoryCache(object):
+    """
+    The memory cache keeps the entries of one process under the limit by
+    evicting the least recently used ones, and may be shared by threads.
+
+    >>> c = MemoryCache(10)
+    >>> c.put('k1', 'ABCD'); c.put('k2', 'EFGH')
+    >>> c.get('k1')
+    'ABCD'
+    >>> c.put('k3', 'IJKL')
+    >>> c.get('k1'), c.get('k2'), c.get('k3')
+    ('ABCD', None, 'IJKL')
+    """
+    def __init__(self, limit):
+        self.limit   = limit
+        self.size    = 0
+        self.entries = OrderedDict()
+        self.lock    = threading.Lock()
+
+    def get(self, key):
+        """
+        @param  string  key  The entry key
+        @return  string  The cached contents, None on a miss
+        """
+        with self.lock:
+            contents = self.entries.pop(key, None)
+            if contents is not None:
+                self.entries[key] = contents # now the most recent
+
+            return contents
+
+    def put(self, key, contents):
+        """
+        Store the contents and evict.
+
+        @param  string  key  The entry key
+        @param  string  contents  The contents
+        """
+        if len(contents) > self.limit:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+
+            self.entries[key] = contents
+            self.size += len(contents)
+
+            # oldest first until we fit
+            while self.size > self.limit:
+                self.size -= len(self.entries.popitem(last=False)[1])
+
+########################################################################
+class ResultCache(object):
+    """
+    The result cache looks an entry up in memory and then on disk, where
+    it is kept for the other processes, and counts the hits and misses.
+    A disk entry is its contents after the HMAC of its key and contents,
+    so that nobody without the secret can plant a result to be unpickled.
+
+    >>> import shutil
+    >>> d = tempfile.mkdtemp()
+    >>> c = ResultCache(d, 100)
+    >>> k = c.key(['1. Stem?'], ['IndexParser', 'JsonWriter'])
+    >>> k == c.key(['1. Stem', '?'], ['IndexParser', 'JsonWriter'])
+    False
+    >>> c.get(k) is None
+    True
+    >>> c.put(k, 'result')
+    >>> c.get(k), ResultCache(d, 100).get(k)
+    ('result', 'result')
+    >>> c.hits, c.misses
+    (1, 1)
+    >>> oct(os.stat(os.path.join(d, ResultCache.secret_name)).st_mode & 0777)
+    '0600'
+    >>> c.disk.put(k, 'x' * 64 + 'planted')
+    >>> ResultCache(d, 100).get(k) is None
+    True
+    >>> shutil.rmtree(d)
+    """
+    extension = '.result'
+    memory_limit = 64 * 1024 * 1024
+    secret_name = 'secret'
+
+    _fingerprint = None
+
+    def __init__(self, directory, limit):
+        self.memory = MemoryCache(min(limit, self.memory_limit))
+        self.disk   = Cache(directory, limit, self.extension)
+        self.hits   = 0
+        self.misses = 0
+        self.secret = None
+
+    def __str__(self):
+        return 'hits %d, misses %d' % (self.hits, self.misses)
+
+    @classmethod
+    def fingerprint(cls):
+        """
+        The size and modification time of the choice modules, so that a
+        changed parser or writer does not get the results of the old one.
+
+        @return  string  The fingerprint
+        """
+        if cls._fingerprint is None:
+            modules = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py')))
+            cls._fingerprint = ' '.join('%s:%d:%d' % (os.path.basename(m), os.path.getsize(m), os.path.getmtime(m)) for m in modules)
+
+        return cls._fingerprint
+
+    def key(self, strings, configuration):
+        """
+        The key for the input strings run thru the router configuration.
+
+        @param  list  strings  The input strings
+        @param  list  configuration  The router options that change the result
+        @return  string  The hex digest key
+        """
+        digest = hashlib.sha1('\0'.join([self.fingerprint()] + [str(c) for c in configuration]) + '\0')
+        for string in strings:
+            digest.update('%d\0' % len(string))
+            digest.update(string)
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        @param  string  key  The entry key
+        @return  string  The cached result, None on a miss
+        """
+        contents = self.memory.get(key)
+        if contents is None:
+            contents = self._verify(key, self.disk.get(key))
+            if contents is not None:
+                self.memory.put(key, contents)
+
+        if contents is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return contents
+
+    def put(self, key, contents):
+        """
+        Store the result in memory and on disk.
+
+        @param  string  key  The entry key
+        @param  string  contents  The result
+        """
+        self.memory.put(key, contents)
+        signature = self._sign(key, contents)
+        if signature:
+            self.disk.put(key, signature + contents)
+
+    def _sign(self, key, contents):
+        """
+        @param  string  key  The entry key
+        @param  string  contents  The result
+        @return  string  The hex HMAC of the key and contents, None when
+                         there is no secret to sign with
+        """
+        secret = self._get_secret()
+        if not secret:
+            return None
+
+        return hmac.new(secret, key + '\0' + contents, hashlib.sha256).hexdigest()
+
+    def _verify(self, key, entry):
+        """
+        @param  string  key  The entry key
+        @param  string  entry  The disk entry, may be None
+        @return  string  The result, None if the entry does not check out
+        """
+        if entry is None:
+            return None
+
+        size = hashlib.sha256().digest_size * 2
+        signature, contents = entry[:size], entry[size:]
+        expected = self._sign(key, contents)
+        if not expected or not hmac.compare_digest(signature, expected):
+            return None
+
+        return contents
+
+    def _get_secret(self):
+        """
+        The secret of the cache directory, written once by whichever process
+        comes first.  A secret that is not the user's own or that others can
+        read is not used, and so neither is the disk.
+
+        @return  string  The secret, empty if there is none to be had
+        """
+        if self.secret is not None:
+            return self.secret
+
+        path = os.path.join(self.disk.directory, self.secret_name)
+        try:
+            if not os.path.exists(path):
+                if not os.path.isdir(self.disk.directory):
+                    os.makedirs(self.disk.directory, 0700)
+
+                # mkstemp makes it 0600, the link fails if another process won
+                secretfile = tempfile.NamedTemporaryFile(dir=self.disk.directory, suffix='.tmp', delete=False)
+                with secretfile:
+                    secretfile.write(os.urandom(32))
+                try:
+                    os.link(secretfile.name, path)
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                finally:
+                    os.remove(secretfile.name)
+
+            with open(path, 'rb') as secretfile:
+                stat = os.fstat(secretfile.fileno())
+                if stat.st_uid != os.getuid() or stat.st_mode & 077:
+                    self.secret = ''
+                else:
+                    self.secret = secretfile.read()
+
+        except EnvironmentError:
+            self.secret = ''
+
+        return self.secret
@@ -0,0 +1,126 @@
+"""
+The corpus generates synthetic multiple choice exams in each of the layouts
+that the parsers and mogrifiers target so that they can be benchmarked on
+inputs much larger than the files in the input directory.
+"""
+import random
+
+########################################################################
+class Corpus(object):
+    """
+    The corpus writes numbered questions in the requested layout until the
+    requested size is reached.  A noise level between 0 and 1 is the share
+    of questions that get damaged, by a dropped option or a stray line, and
+    the same seed always gives the same corpus.
+
+    >>> c = Corpus(seed=1)
+    >>> print c.generate('index', 100)
+    1. ... ...?
+    A.     ...
+    B.     ...
+    C.     ...
+    D.     ...
+    <BLANKLINE>
+    >>> len(c.generate('quest', 1024)) <= 1024
+    True
+    >>> Corpus(seed=1).generate('chunk', 4096) == Corpus(seed=1).generate('chunk', 4096)
+    True
+    >>> from parser import IndexParser
+    >>> len(IndexParser().parse(Corpus(seed=2).generate('index', 4096)).questions) > 10
+    True
+    """
+    layouts = ('index', 'quest', 'stems', 'chunk', 'boolean', 'splitstem')
+
+    words = (
+        'the', 'which', 'of', 'following', 'is', 'a', 'an', 'best', 'most',
+        'likely', 'cause', 'reason', 'patient', 'driver', 'account', 'asset',
+        'liability', 'brake', 'engine', 'cell', 'plant', 'water', 'light',
+        'energy', 'market', 'price', 'value', 'should', 'will', 'never',
+        'always', 'when', 'after', 'before', 'during', 'between', 'under',
+        'increase', 'decrease', 'change', 'result', 'effect', 'system',
+        )
+
+    def __init__(self, seed=None, noise=0.0):
+        self.random = random.Random(seed)
+        self.noise  = noise
+
+    def generate(self, layout, size):
+        """
+        Generate a corpus of whole questions of at most size bytes, but
+        always at least one question.
+
+        @param  string  layout  One of the layouts
+        @param  int  size  The maximum corpus size in bytes
+        @return  string  The corpus
+        """
+        format = getattr(self, '_' + layout)
+        questions = []
+        length = 0
+        number = 1
+
+        while True:
+            question = self._damage(format(number))
+            if questions and length + len(question) > size:
+                break
+            questions.append(question)
+            length += len(question)
+            number += 1
+
+        return ''.join(questions)
+
+    def _sentence(self, low, high):
+        return ' '.join(self.random.choice(self.words) for i in xrange(self.random.randint(low, high)))
+
+    def _stem(self):
+        return self._sentence(6, 14) + '?'
+
+    def _options(self, count=4):
+        return [self._sentence(1, 6) for i in xrange(count)]
+
+    def _damage(self, question):
+        """
+        Damage the question at the noise level by dropping one of its lines
+        or by adding a stray line of text.
+        """
+        if not self.noise or self.random.random() >= self.noise:
+            return question
+
+        lines = question.split('\n')
+        if self.random.random() < 0.5 and len(lines) > 2:
+            del lines[self.random.randint(1, len(lines) - 2)]
+        else:
+            lines.insert(self.random.randint(1, len(lines) - 1), self._sentence(3, 10))
+
+        return '\n'.join(lines)
+
+    # Layouts
+    # ------------------------------------------------------------------
+
+    def _index(self, number):
+        # IndexParser: numbered stems and lettered options a line each
+        options = ['%s.     %s' % (l, o) for l, o in zip('ABCD', self._options())]
+        return '%d. %s\n%s\n\n' % (number, self._stem(), '\n'.join(options))
+
+    def _quest(self, number):
+        # QuestParser: the A: B: options run inline after the stem
+        a, b, c, d = self._options()
+        return '%d. %s:A: %sB: %s\nC: %s D: %s\n' % (number, self._stem()[:-1], a, b, c, d)
+
+    def _stems(self, number):
+        # StemsParser: a blank line between the stem and its option lines
+        return '%d. %s\n\n%s\n\n' % (number, self._stem(), '\n'.join(o.capitalize() + '.' for o in self._options(3)))
+
+    def _chunk(self, number):
+        # ChunkParser: a block of a) b) c) d) options
+        options = ['%s) %s' % (l, o) for l, o in zip('abcd', self._options())]
+        return '%d. %s\n%s\n\n' % (number, self._stem(), '\n'.join(options))
+
+    def _boolean(self, number):
+        # BooleanoptionMogrifyer: Yes No in front of every option
+        options = ['  Yes  No  %s. %s' % (l, o) for l, o in zip('abc', self._options(3))]
+        return '%d. %s\n%s\n' % (number, self._stem(), '\n'.join(options))
+
+    def _splitstem(self, number):
+        # SplitstemMogrifyer: a line-break right after the stem index
+        options = ['  %s. %s' % (l, o) for l, o in zip('abc', self._options(3))]
+        return '%d.\n%s\n%s\n' % (number, self._stem(), '\n'.join(options))
@@ -2,6 +2,50 @@
 import re
 
 from router import Question
+from question import SpanQuestion
+
+########################################################################
+class FilterChain (object):
+    """
+    The filter chain applies all of its filters to each question in turn,
+    in a single pass over the questions, each filter giving its stem() and
+    option() string transforms.  The questions are yielded as they are
+    filtered so a chain can run over a question stream, and in place the
+    filtered strings are stored back into the questions instead of into a
+    new set of questions, span questions being read-only are still copied.
+
+    >>> from question import Question
+    >>> q = Question()
+    >>> q.stem = ' 1.  What is the  FilterChain?'
+    >>> q.options.append(' a.  A choice-parser component.')
+    >>> c = FilterChain([IndexFilter(), WhitespaceFilter(), QualifiedFilter()], inplace=True)
+    >>> f = list(c.filter([q]))
+    >>> f[0] is q, q.stem, q.options
+    (True, 'stem = 1. What is the FilterChain?', ['option = a. A choice-parser component.'])
+    """
+    def __init__(self, filters, inplace=False):
+        self.filters = list(filters)
+        self.inplace = inplace
+
+    def filter(self, questions):
+        """
+        @param  iterable  questions  The questions to filter
+        @return  generator  The filtered questions
+        """
+        for question in questions:
+            stem = question.stem
+            options = list(question.options)
+            for filter in self.filters:
+                stem = filter.stem(stem)
+                options = [filter.option(option) for option in options]
+
+            if not self.inplace or isinstance(question, SpanQuestion):
+                question = Question()
+
+            question.stem = stem
+            question.options = options
+
+            yield question
 
 ########################################################################
 class IndexFilter (object):
@@ -23,24 +67,17 @@ class IndexFilter (object):
     >>> len(q.options)
     3
     """
-    def filter(self, questions):
-        filtered_questions = []
-
-        for question in questions:
-            q = Question()
-
-            match = re.match(r"^[0-9]*\.?(.*)$", question.stem)
-            if match:
-                q.stem = match.group(1)
-            else:
-                q.stem = question.stem
+    index = re.compile(r"^[0-9]*\.?(.*)$")
 
-            for option in question.options:
-                q.options.append(option)
+    def filter(self, questions):
+        return list(FilterChain([self]).filter(questions))
 
-            filtered_questions.append(q)
+    def stem(self, stem):
+        match = self.index.match(stem)
+        return match.group(1) if match else stem
 
-        return filtered_questions
+    def option(self, option):
+        return option
 
 ########################################################################
 class WhitespaceFilter (object):
@@ -63,18 +100,13 @@ class WhitespaceFilter (object):
     3
     """
     def filter(self, questions):
-        filtered_questions = []
+        return list(FilterChain([self]).filter(questions))
 
-        for question in questions:
-            q = Question()
-            q.stem = re.sub(r"\s+", ' ', question.stem).strip()
-
-            for option in question.options:
-                q.options.append(re.sub(r"\s+", ' ', option).strip())
-
-            filtered_questions.append(q)
+    def stem(self, stem):
+        # the same as re.sub(r"\s+", ' ', stem).strip() in one pass
+        return ' '.join(stem.split())
 
-        return filtered_questions
+    option = stem
 
 ########################################################################
 class QualifiedFilter (object):
@@ -97,15 +129,10 @@ class QualifiedFilter (object):
     3
     """
     def filter(self, questions):
-        filtered_questions = []
-
-        for question in questions:
-            q = Question()
-            q.stem = 'stem = %s' % question.stem
-
-            for option in question.options:
-                q.options.append('option = %s' % option)
+        return list(FilterChain([self]).filter(questions))
 
-            filtered_questions.append(q)
+    def stem(self, stem):
+        return 'stem = %s' % stem
 
-        return filtered_questions
+    def option(self, option):
+        return 'option = %s' % option
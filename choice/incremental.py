@@ -0,0 +1,104 @@
+"""
+The incremental state keeps the questions of each question block of the
+last parse of a document so that after the document is edited only the
+blocks that changed have to be parsed again.
+"""
+import os
+import cPickle
+import hashlib
+import tempfile
+
+########################################################################
+class State(object):
+    """
+    The state is saved to its file after each run together with the router
+    configuration and the parser class that made it, and only a state of
+    the same configuration is loaded.  A document is blockwise if parsing
+    it one block at a time gives the very same questions as parsing it as
+    a whole, which is checked on the full parse, and only then are the
+    blocks kept.
+
+    >>> import shutil
+    >>> d = tempfile.mkdtemp()
+    >>> s = State(os.path.join(d, 'state'))
+    >>> s.load(['IndexParser'])
+    {}
+    >>> s.update(['IndexParser'], 'IndexParser', True, [(s.digest('1. One?'), 0, ['q1'])])
+    >>> s.save()
+    >>> s = State(os.path.join(d, 'state'))
+    >>> s.load(['IndexParser']) == {s.digest('1. One?'): ['q1']}, s.parser
+    (True, 'IndexParser')
+    >>> s.load(['ChunkParser'])
+    {}
+    >>> shutil.rmtree(d)
+    """
+    version = 1
+
+    def __init__(self, path):
+        self.path          = path
+        self.configuration = None
+        self.parser        = None
+        self.blockwise     = False
+        self.blocks        = []
+
+    def digest(self, block):
+        """
+        @param  string  block  The question block
+        @return  string  The block digest
+        """
+        return hashlib.sha1(block).digest()
+
+    def load(self, configuration):
+        """
+        Load the state of the last run if it was made with the configuration.
+
+        @param  list  configuration  The router options that change the result
+        @return  dict  The questions of each block digest, empty if there is
+                       no state or it is not blockwise
+        """
+        try:
+            with open(self.path, 'rb') as statefile:
+                state = cPickle.load(statefile)
+
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return {}
+
+        if state.get('version') != self.version or state['configuration'] != configuration:
+            return {}
+
+        self.configuration = state['configuration']
+        self.parser        = state['parser']
+        self.blockwise     = state['blockwise']
+        self.blocks        = state['blocks']
+
+        return dict((digest, questions) for digest, offset, questions in self.blocks)
+
+    def update(self, configuration, parser, blockwise, blocks):
+        """
+        @param  list  configuration  The router options that change the result
+        @param  string  parser  The parser class name
+        @param  bool  blockwise  Whether the blocks parse as the whole does
+        @param  list  blocks  The (digest, offset, questions) of each block
+        """
+        self.configuration = configuration
+        self.parser        = parser
+        self.blockwise     = blockwise
+        self.blocks        = blocks if blockwise else []
+
+    def save(self):
+        """
+        Write the state to a temporary file moved into place so that an
+        interrupted run never leaves half a state.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        statefile = tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False)
+        with statefile:
+            cPickle.dump({
+                'version': self.version,
+                'configuration': self.configuration,
+                'parser': self.parser,
+                'blockwise': self.blockwise,
+                'blocks': self.blocks,
+                }, statefile, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(statefile.name, self.path)
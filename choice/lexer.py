@@ -0,0 +1,98 @@
+"""
+The lexer classifies each line of the input once so that the line based
+parsers do not have to run their own regexes over every line.
+"""
+import re
+
+from array import array
+
+BLANK  = 0 # nothing but white-space
+TEXT   = 1 # a continuation line
+STEM   = 2 # starts with a stem index:  1.
+OPTION = 3 # starts with an option marker:  a:  (a)  [a]
+LETTER = 4 # starts with a plain option marker:  a.  a)
+
+########################################################################
+class Lexer(object):
+    """
+    The lexer splits the input string into lines and classifies each one
+    as a blank, a continuation, a stem index or an option marker, storing
+    the classes and option letters in compact arrays.  Note that every
+    LETTER line is also an OPTION line.
+
+    >>> l = Lexer('''1. What is the Lexer?
+    ... a. A choice-parser component.
+    ... (b) A line classifier.
+    ...
+    ... Both of the above.''')
+    >>> list(l.kinds)
+    [2, 4, 3, 0, 1]
+    >>> l.letters.tostring()
+    ' ab  '
+    >>> len(l.tokens)
+    4
+    """
+    classifier = re.compile(r'^\s*(?:(\d+\.\s)|([a-zA-Z])[.)] |[\[\(]?([a-zA-Z])[.):\]]\s)')
+
+    # the last few lexers are kept so that all the parsers run over the
+    # same input strings share one lexing pass
+    cachesize = 8
+    _cache = []
+
+    def __init__(self, string):
+        self.string  = string
+        self.lines   = string.split('\n')
+        self.kinds   = array('B')
+        self.letters = array('c')
+        self.tokens  = []
+
+        for line in self.lines:
+            if not line.strip():
+                self.kinds.append(BLANK)
+                self.letters.append(' ')
+                continue
+
+            self.tokens.append(line)
+            match = self.classifier.match(line)
+            if not match:
+                self.kinds.append(TEXT)
+                self.letters.append(' ')
+            elif match.group(1):
+                self.kinds.append(STEM)
+                self.letters.append(' ')
+            elif match.group(2):
+                self.kinds.append(LETTER)
+                self.letters.append(match.group(2))
+            else:
+                self.kinds.append(OPTION)
+                self.letters.append(match.group(3))
+
+    @classmethod
+    def lex(cls, string):
+        """
+        Return the lexer for the string, reusing a recent one if it was
+        for the very same string object.
+
+        @param  string  The input string
+        @return  Lexer  The lexed input
+
+        >>> s = '1. Stem'
+        >>> Lexer.lex(s) is Lexer.lex(s)
+        True
+        """
+        for lexer in cls._cache:
+            if lexer.string is string:
+                return lexer
+
+        lexer = cls(string)
+        cls._cache[:] = [lexer] + cls._cache[:cls.cachesize - 1]
+
+        return lexer
+
+    def __iter__(self):
+        """
+        Iterate over the (kind, line) pairs of the non-blank lines.
+        """
+        for kind, line in zip(self.kinds, self.lines):
+            if kind != BLANK:
+                yield kind, line
@@ -3,6 +3,7 @@ Mogrification takes the input string and does some massaging and then returns
 the results.
 """
 import re
+import time
 
 ########################################################################
 class BooleanoptionMogrifyer (object):
@@ -22,11 +23,12 @@ class BooleanoptionMogrifyer (object):
       b. A Mogrifyer class.
       c. Both of the above.
     """
-    def mogrify(self, string):
+    # compiled once per process, not on every call
+    boolean = re.compile(r"^(\s*yes\s+no(?=\s+[a-z]\.))", re.IGNORECASE | re.MULTILINE)
 
-        p = re.compile(r"^(\s*yes\s+no(?=\s+[a-z]\.))", re.IGNORECASE | re.MULTILINE)
+    def mogrify(self, string):
 
-        return p.sub('', string)
+        return self.boolean.sub('', string)
 
 ########################################################################
 class SplitstemMogrifyer (object):
@@ -57,38 +59,38 @@ class SplitstemMogrifyer (object):
       b. A Mogrifyer class.
       c. Both of the above.
     """
+    stem_index               = r'\n\s*[0-9]+\.'           #  \n1.
+    stem_body                = r'.*?'                     #  What is the SplitstemMogrifyer? (nongreedy)
+    option_index_with_dot    = r'(\n\s*\(?[Aa](?:\.|\)))' #  \n A. | A) | (A)  (match group 2)
+    option_index_without_dot = r'(:\s*\n\s*[Aa])'         # :\nA  (match group 3)
+
+    re_stem = re.compile(r"({si}{sb})(?:{a1}|{a2})".format(
+        si =stem_index,
+        sb =stem_body,
+        a1 =option_index_with_dot,
+        a2 =option_index_without_dot,
+        ), re.IGNORECASE | re.DOTALL)
+
+    option_a =    r'(\(?[Aa](?:\.|\))\s*.*?\n)'
+    option_b =    r'(\(?[Bb](?:\.|\))\s*.*?\n)'
+    option_c =    r'(\(?[Cc](?:\.|\))\s*.*?\n)'
+    option_d = r'((?:\(?[Dd](?:\.|\))\s*.*?\n)?)'
+    option_e = r'((?:\(?[Ee](?:\.|\))\s*.*?\n)?)'
+
+    re_options = re.compile(r"{a}{b}{c}{d}{e}".format(
+        a=option_a,
+        b=option_b,
+        c=option_c,
+        d=option_d,
+        e=option_e,
+        ), re.MULTILINE | re.DOTALL)
+
     def mogrify(self, string):
 
-        stem_index               = r'\n\s*[0-9]+\.'           #  \n1.
-        stem_body                = r'.*?'                     #  What is the SplitstemMogrifyer? (nongreedy)
-        option_index_with_dot    = r'(\n\s*\(?[Aa](?:\.|\)))' #  \n A. | A) | (A)  (match group 2)
-        option_index_without_dot = r'(:\s*\n\s*[Aa])'         # :\nA  (match group 3)
-
-        regex = r"({si}{sb})(?:{a1}|{a2})".format(
-            si =stem_index,
-            sb =stem_body,
-            a1 =option_index_with_dot,
-            a2 =option_index_without_dot,
-            )
-        re_stem = re.compile(regex, re.IGNORECASE | re.DOTALL)
-
-        a =    r'(\(?[Aa](?:\.|\))\s*.*?\n)'
-        b =    r'(\(?[Bb](?:\.|\))\s*.*?\n)'
-        c =    r'(\(?[Cc](?:\.|\))\s*.*?\n)'
-        d = r'((?:\(?[Dd](?:\.|\))\s*.*?\n)?)'
-        e = r'((?:\(?[Ee](?:\.|\))\s*.*?\n)?)'
-
-        regex = r"{a}{b}{c}{d}{e}".format(
-            a=a,
-            b=b,
-            c=c,
-            d=d,
-            e=e,
-            )
-        re_options = re.compile(regex, re.MULTILINE | re.DOTALL)
-
-        mogrified_string = re_stem   .sub(self.__yank_newlines_from_stem, string, 0)
-        mogrified_string = re_options.sub(self.__yank_newlines_from_options, mogrified_string, 0)
+        # the options pass runs over the output of the stem pass as the
+        # joined stem lines change where the option lines start
+        mogrified_string = self.re_stem   .sub(self.__yank_newlines_from_stem, string, 0)
+        mogrified_string = self.re_options.sub(self.__yank_newlines_from_options, mogrified_string, 0)
 
         return mogrified_string
 
@@ -111,3 +113,44 @@ class SplitstemMogrifyer (object):
 
         ret = '%s%s%s%s%s' % (m1, m2, m3, m4, m5)
         return ret
+
+########################################################################
+class MogrifyerChain (list):
+    """
+    The mogrifyer chain is the list of mogrifyers that runs them one after
+    the other over the input strings counting the bytes each one has been
+    run over and the time it took, so that the stats show which mogrifyer
+    dominates.
+
+    >>> c = MogrifyerChain([BooleanoptionMogrifyer()])
+    >>> c.mogrify('1. Stem\\n Yes No a. one\\n')
+    '1. Stem\\n a. one\\n'
+    >>> c.counters['BooleanoptionMogrifyer'][0]
+    23
+    >>> c
+    [BooleanoptionMogrifyer 23 bytes ... MB/s]
+    """
+    def __init__(self, mogrifyers=()):
+        super(MogrifyerChain, self).__init__(mogrifyers)
+        self.counters = dict((m.__class__.__name__, [0, 0.0]) for m in self)
+
+    def mogrify(self, string):
+        """
+        @param  string  string  The input string to mogrify
+        @return  string  The mogrified string
+        """
+        for mogrifyer in self:
+            counter = self.counters[mogrifyer.__class__.__name__]
+            start = time.time()
+            counter[0] += len(string)
+            string = mogrifyer.mogrify(string)
+            counter[1] += time.time() - start
+
+        return string
+
+    def __repr__(self):
+        return '[%s]' % ', '.join('%s %d bytes %.1f MB/s' % (
+            name,
+            self.counters[name][0],
+            self.counters[name][0] / self.counters[name][1] / 1e6 if self.counters[name][1] else 0.0,
+            ) for name in (m.__class__.__name__ for m in self))
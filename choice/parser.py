@@ -1,7 +1,11 @@
 
+import os
 import re
+import mmap
 
 from question import Question
+from question import SpanQuestion
+from lexer    import Lexer, STEM, OPTION, LETTER
 
 ########################################################################
 class Parser(object):
@@ -10,10 +14,17 @@ class Parser(object):
     tokens to determine what is the stem and what are the options.
     """
     maxlen = 100000
-    
+    boundaries = (
+        re.compile(r'\n\n(?=[0-9]+\.)'),         # blank line and stem index
+        re.compile(r'(?<=\n)(?=[0-9]+\.?\s)'),   # stem index at line start
+        re.compile(r'\n\n'),                    # blank line
+        re.compile(r'\n'),                      # line-break
+        )
+
     def __init__(self):
         self._questions  = []
         self._tokens     = []
+        self._lexer      = None
 
     def __str__(self):
         return "<%s.%s tokens=%d, questions=%d>" % (
@@ -23,19 +34,33 @@ class Parser(object):
             len(self._questions),
             )
 
+    def __getstate__(self):
+        """
+        Pickle only the parsed state, the tokenizer methods are set up
+        again by __init__() when unpickled.
+
+        >>> import pickle
+        >>> p = pickle.loads(pickle.dumps(ChunkParser().parse('1. Stem\\na. one\\nb. two\\nc. three\\nd. four\\n')))
+        >>> len(p.questions), len(p.tokens)
+        (1, 3)
+        """
+        return {'_questions': self._questions, '_tokens': self._tokens}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
     def _tokenize(self, string):
         """
-        Split input string into tokens based on line-breaks.
+        Split input string into tokens based on line-breaks, using the
+        shared Lexer so the lines are only split and classified once for
+        all the line based parsers.
 
         @param  string  The input string
         @return  list  The tokenized input
         """
-        self._tokens = []
-
-        # Split and strip the input string by newlines
-        for token in re.split('(.*)', string):
-            if token.strip() != '':
-                self._tokens.append(token)
+        self._lexer  = Lexer.lex(string)
+        self._tokens = self._lexer.tokens
 
     def _stemify(self, string):
         """
@@ -64,6 +89,157 @@ class Parser(object):
         if len(string) > self.maxlen:
             raise OverflowError, 'String of %d bytes is too long, %d max' % (len(string), self.maxlen)
 
+    def windows(self, inputfile, size=None):
+        """
+        Read the input file in bounded windows of at most ``size`` bytes.
+
+        Each window is cut at the last question boundary it contains, the
+        ``\\n\\n[0-9]+\\.`` stem start that _stemify() looks for, and the
+        remainder is carried over into the next window.  If a window has
+        no such boundary we fall back to the last stem index at the start
+        of a line, as in files without blank lines, then to the last blank
+        line and then to the last line-break so that a line is never split.
+
+        @param  inputfile  File  The open input file object
+        @param  size  int  The maximum window size, defaults to maxlen
+        @return  generator  The input windows
+
+        >>> from StringIO import StringIO
+        >>> i = StringIO('1. One?\\na. yes\\n\\n2. Two?\\na. no\\n')
+        >>> [w for w in Parser().windows(i, 24)]
+        ['1. One?\\na. yes', '\\n\\n2. Two?\\na. no\\n']
+        >>> i = StringIO('1 One?\\na. yes\\n2 Two?\\na. no\\n')
+        >>> [w for w in Parser().windows(i, 20)]
+        ['1 One?\\na. yes\\n', '2 Two?\\na. no\\n']
+        """
+        size = size or self.maxlen
+
+        if isinstance(inputfile, MappedFile):
+            for window in self._mapped_windows(inputfile, size):
+                yield window
+            return
+
+        buffer = ''
+
+        while True:
+            chunk = inputfile.read(size - len(buffer))
+            buffer += chunk
+            if not chunk or len(buffer) < size:
+                break
+
+            # the carried over buffer starts with a boundary so skip it
+            cut = -1
+            for boundary in self.boundaries:
+                for match in boundary.finditer(buffer, 1):
+                    cut = match.start()
+                if cut > 0:
+                    break
+            if cut <= 0:
+                cut = len(buffer)
+
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+
+        if buffer:
+            yield buffer
+
+    def _mapped_windows(self, mapped, size):
+        """
+        The windows() of a memory-mapped file.  The boundaries are searched
+        for in the mapped file itself so that each window is copied out of
+        the map only once instead of being read, carried and sliced, and
+        only a segment of a few windows is mapped at a time so that the
+        resident memory does not grow with the size of the file.
+
+        @param  MappedFile  mapped  The memory-mapped input file
+        @param  int  size  The maximum window size
+        @return  generator  The input windows
+
+        >>> import tempfile
+        >>> f = tempfile.TemporaryFile()
+        >>> f.write('1. One?\\na. yes\\n\\n2. Two?\\na. no\\n'); f.flush()
+        >>> [w for w in Parser().windows(MappedFile(f), 24)]
+        ['1. One?\\na. yes', '\\n\\n2. Two?\\na. no\\n']
+        """
+        start = 0
+        segment, base = None, 0
+
+        while mapped.length - start >= size:
+            end = start + size
+            if segment is None or end > base + len(segment):
+                if segment:
+                    segment.close()
+                segment, base = mapped.segment(start, 2 * size)
+
+            # the window starts with a boundary so skip it
+            cut = -1
+            for boundary in self.boundaries:
+                for match in boundary.finditer(segment, start + 1 - base, end - base):
+                    cut = base + match.start()
+                if cut > 0:
+                    break
+            if cut <= 0:
+                cut = end
+
+            yield segment[start - base:cut - base]
+            start = cut
+
+        if segment:
+            segment.close()
+
+        if start < mapped.length:
+            segment, base = mapped.segment(start, mapped.length - start)
+            yield segment[start - base:]
+            segment.close()
+
+    def stream(self, inputfile, size=None):
+        """
+        Parse the input file one window at a time with a fresh instance of
+        this parser class and yield the questions as they are parsed so
+        that the memory used stays flat no matter how large the input is.
+
+        @param  inputfile  File  The open input file object
+        @param  size  int  The maximum window size, defaults to maxlen
+        @return  generator  The parsed questions
+
+        >>> from StringIO import StringIO
+        >>> i = StringIO('1. One?\\na. yes\\nb. no\\n\\n2. Two?\\na. yes\\nb. no\\n')
+        >>> [q.stem for q in IndexParser().stream(i, 24)]
+        ['1. One?', '2. Two?']
+        """
+        for window in self.windows(inputfile, size):
+            for question in self.__class__().parse(window).questions:
+                yield question
+
+    def blocks(self, string):
+        """
+        Cut the string at every question boundary, the stem starts after a
+        blank line or else at the start of a line, into the question blocks
+        that can each be parsed on their own.
+
+        @param  string  string  The input string
+        @return  generator  The (offset, block) of each block
+
+        >>> list(Parser().blocks('1. One?\\na. yes\\n\\n2. Two?\\na. no\\n'))
+        [(0, '1. One?\\na. yes'), (14, '\\n\\n2. Two?\\na. no\\n')]
+        >>> list(Parser().blocks('One?\\na. yes'))
+        [(0, 'One?\\na. yes')]
+        """
+        cuts = []
+        for boundary in self.boundaries[:2]:
+            cuts = [match.start() for match in boundary.finditer(string, 1)]
+            if cuts:
+                break
+
+        start = 0
+        for cut in cuts:
+            if cut > start:
+                yield start, string[start:cut]
+                start = cut
+
+        if start < len(string) or not start:
+            yield start, string[start:]
+
     @property
     def questions(self):
         """
@@ -82,6 +258,53 @@ class Parser(object):
         """
         return self._tokens
 
+########################################################################
+class MappedFile(object):
+    """
+    A mapped file maps segments of an open file for the Parser.windows()
+    of a large plain text input.
+
+    >>> import tempfile
+    >>> f = tempfile.TemporaryFile()
+    >>> f.write('1. One?\\r\\na. yes\\r\\n'); f.flush()
+    >>> m = MappedFile(f)
+    >>> m.length, m.find('\\r')
+    (17, 7)
+    """
+    def __init__(self, inputfile):
+        self.fileno = inputfile.fileno()
+        self.length = os.fstat(self.fileno).st_size
+
+    def segment(self, start, length):
+        """
+        Map at least length bytes of the file from start, up to its end.
+
+        @param  int  start  The file offset
+        @param  int  length  The minimum length
+        @return  tuple  The mmap and the file offset it starts at
+        """
+        base = start - start % mmap.ALLOCATIONGRANULARITY
+        length = min(self.length, start + length + mmap.ALLOCATIONGRANULARITY) - base
+
+        return mmap.mmap(self.fileno, length, access=mmap.ACCESS_READ, offset=base), base
+
+    def find(self, string, blocksize=1 << 20):
+        """
+        Find the first offset of the string in the file, a segment at a
+        time.
+
+        @param  string  string  The string to find
+        @return  int  The offset, -1 if not found
+        """
+        for start in xrange(0, self.length, blocksize):
+            segment, base = self.segment(start, blocksize)
+            offset = segment.find(string, start - base)
+            segment.close()
+            if offset != -1:
+                return base + offset
+
+        return -1
+
 ########################################################################
 class SingleParser (Parser):
     """
@@ -140,9 +363,8 @@ class IndexParser (Parser):
         question = None
         self._tokenize(string)
 
-        for token in self._tokens:
-            s = re.match(r"^\s*\d+\.\s", token)
-            if s and s.group():
+        for kind, token in self._lexer:
+            if kind == STEM:
                 if question and len(question.options) > 0:
                     self._questions.append(question)
                 question = Question()
@@ -150,8 +372,7 @@ class IndexParser (Parser):
                 continue
 
             if question is not None:
-                o = re.match(r"^\s*[\[\(]?[a-zA-Z][.):\]]\s", token)
-                if o and o.group():
+                if kind in (OPTION, LETTER):
                     question.options.append(token)
 
         if question and len(question.options) > 0:
@@ -181,9 +402,8 @@ class BlockParser (Parser):
         option = False
 
         self._tokenize(string)
-        for token in self._tokens:
-            o = re.match(r"^\s*[a-zA-Z][.)] ", token)
-            if o and o.group():
+        for kind, token in self._lexer:
+            if kind == LETTER:
                 option = True
                 try:
                     assert question is not None
@@ -237,6 +457,8 @@ class ChunkParser (Parser):
         super(ChunkParser, self).__init__()
         self._tokenize = self._chunk
 
+    option_marker = re.compile(r'(?:^|(?<=\s))\**(?:([a-e])\.|\(?([a-e])\))\s+', re.IGNORECASE | re.MULTILINE)
+
     def _chunk(self, string):
         """
         Split input string into tokens based on option groups.  In other
@@ -244,42 +466,58 @@ class ChunkParser (Parser):
         maybe D and E, then assume the stems are the bits between the
         option groups.
 
+        The option markers are found in a single forward pass and runs
+        of consecutive letters, a-c with an optional d and e, make up the
+        option groups so there is no backtracking on large input.  Each
+        option ends where the next marker starts.
+
         ..note: There is no way to determine when the last option has
         ended in this particular parser which only looks for the option
         sets.  We can't be certain if the the following lines are part
-        of the option or part of the next question.  Therefore we cut
-        the last option off at the first linefeed, which may, and will
-        truncate the last option if it indeed contains linefeeds
-
-        ..note: Also of note is that if there are only four options:
-        a, b, c, d - then the fourth option will be only one character
-        long since it is using non-greedy dot matching.
+        of the option or part of the next question.  Therefore we end
+        the last option at the end of its first line, or at the next
+        option marker if that comes first.
 
         @todo Take the **** at the beginning of an option, to denote the
         correct answer.
 
         @param  string  The input string
         @return  list  The tokenized input
+
+        >>> p = ChunkParser()
+        >>> p._chunk('1. Stem\\na) one\\nb) two\\nc) three four\\n2. Next')
+        >>> p.tokens
+        ['1. Stem\\n', 'a) one\\nb) two\\nc) three four', '\\n2. Next']
+        >>> p._options
+        [['a) one\\n', 'b) two\\n', 'c) three four']]
         """
-        #~ a = r'\**\s*(?:a\.?|\(?a\))' #SMA option dot now required
-        a = r'\**\s*(?:a\.|\(?a\))'
-        b = r'\**\s*(?:b\.|\(?b\))'
-        c = r'\**\s*(?:c\.|\(?c\))'
-        d = r'\**\s*(?:d\.|\(?d\))'
-        e = r'\**\s*(?:e\.|\(?e\))'
-        l = r'\s+.+?\s+'
-        #                                    last option trucated here \/
-        regex = r"({a}{line}{b}{line}{c}{line}(?:{d}{line})(?:{e}.*?)?)\n?".format(
-            a=a, b=b, c=c, d=d, e=e, line=l, 
-            )
-        p = re.compile(regex, re.IGNORECASE | re.DOTALL)
+        self._tokens  = []
+        self._options = []
+        last = 0
+        run  = []
+
+        # a trailing None marker closes the last run
+        for marker in list(self.option_marker.finditer(string)) + [None]:
+            letter = (marker.group(1) or marker.group(2)).lower() if marker else None
+            if run and letter == chr(ord(run[-1][1]) + 1) and letter <= 'e':
+                run.append((marker, letter))
+                continue
+
+            if len(run) >= 3:
+                start = run[0][0].start()
+                limit = marker.start() if marker else len(string)
+                end = string.find('\n', run[-1][0].end(), limit)
+                end = end if end >= 0 else limit
+                starts = [m.start() for m, l in run] + [end]
+                self._tokens.extend((string[last:start], string[start:end]))
+                self._options.append([string[starts[n]:starts[n+1]] for n in range(0, len(run))])
+                last = end
+
+            run = [(marker, letter)] if letter == 'a' else []
 
-        self._tokens = p.split(string)
+        self._tokens.append(string[last:])
 
     def parse(self, string):
-        re_index  = r'\**\s*(?:[A-Ea-e]\.|\(?[A-Ea-e]\))'
-        re_body   = r'.+'
-        re_option = r'({index}\s+{body})'.format(index=re_index, body=re_body)
         self._tokenize(string)
 
         # spin thru the input chunks two at a time, the first being the
@@ -294,9 +532,8 @@ class ChunkParser (Parser):
                 #~ stem = re.search(r"(?:[0-9]+\s+(?:.|\n)+$)+?|(?:\n*.+$)", self._tokens[st_index])
                 question.stem = stem.group().strip() if stem else self._tokens[st_index] 
 
-                options = [o.strip() for o in re.split(re_option, self._tokens[op_index]) if o.strip()]
-                for option in options:
-                    question.options.append(option)
+                for option in self._options[op_index // 2]:
+                    question.options.append(option.strip())
 
                 self._questions.append(question)
 
@@ -305,7 +542,8 @@ class ChunkParser (Parser):
 ########################################################################
 class QuestParser (Parser):
     """
-    The quest parser uses the _quest() tokenizer.
+    The quest parser uses the _scan() tokenizer, a linear-time scanner
+    that creates the same tokens as the original _quest() regex.
 
     >>> from router import Router
     >>> r = Router()
@@ -333,7 +571,7 @@ class QuestParser (Parser):
 
     def __init__(self):
         super(QuestParser, self).__init__()
-        self._tokenize = self._quest
+        self._tokenize = self._scan
 
     def _format(self, regex):
         return regex.format(
@@ -354,6 +592,9 @@ class QuestParser (Parser):
         Create one token for each question, including the stem and the
         options in the token.
 
+        ..note: This regex backtracks badly on malformed input and is only
+        kept as the reference for the _scan() tokenizer.
+
         @param  string  The input string
         @return  list  The tokenized input
         """
@@ -362,25 +603,251 @@ class QuestParser (Parser):
 
         self._tokens = p.split(string) # re.IGNORECASE doesn't really work unless you re.compile it
 
+    def _quest_groups(self, token):
+        """
+        The regex version of _groups() that goes with _quest().  Neither
+        is used by parse() anymore, they are kept as the reference that the
+        scanner is checked against.
+
+        @param  token  The question token
+        @return  list  The stem and option strings, None if not a question
+        """
+        regex = self._format(r"({i}{w}{body})({a}{w}{body})({b}{w}{body})({c}{w}{body})({d}{w}{body})?({e}{w}{ebody})?{lb}")
+        match = re.search(regex, token, re.DOTALL | re.IGNORECASE)
+
+        return list(match.groups()[0:6]) if match else None
+
+    def _scan(self, string):
+        """
+        Create the same tokens as _quest() but find the stem index and the
+        option markers with a forward scan instead of the one large regex
+        whose lazy bodies backtrack badly on malformed or large input.
+
+        @param  string  The input string
+        @return  list  The tokenized input
+        """
+        scanner = _QuestScanner(self, string, lookahead=True)
+        start = re.compile(self._format(r"(?<=\n){i}{w}"))
+        self._tokens = []
+        self._spans  = []
+        last = pos = 0
+
+        while True:
+            match = start.search(string, pos)
+            if not match:
+                break
+            elements = scanner.match(match.start())
+            if not elements:
+                pos = match.start() + 1
+                continue
+            end = elements[-1][1]
+            self._tokens.extend((string[last:match.start()], string[match.start():end]))
+            self._spans.extend(((last, match.start()), (match.start(), end)))
+            last = pos = end
+
+        self._tokens.append(string[last:])
+        self._spans.append((last, len(string)))
+
+    def _groups(self, token):
+        """
+        Find the stem and the options in a question token, returning the
+        same groups as the parse() regex would.
+
+        @param  token  The question token
+        @return  list  The stem and option strings, None if not a question
+        """
+        spans = self._group_spans(token, 0, len(token))
+
+        return [token[slice(*span)] if span else None for span in spans] if spans else None
+
+    def _group_spans(self, string, start, end):
+        """
+        Find the stem and the options in the question token that is the
+        stripped string[start:end], returning the (start, end) offsets of
+        the groups into the string.
+
+        @param  string  The input string
+        @param  start  int  The start of the question token
+        @param  end  int  The end of the question token
+        @return  list  The stem and option offsets, None if not a question
+        """
+        scanner = _QuestScanner(self, string, lookahead=False, end=end)
+        for match in scanner.index.finditer(string, start, end):
+            elements = scanner.match(match.start())
+            if elements:
+                spans = dict((kind, (elements[n][1], elements[n+1][1])) for n, (kind, pos) in enumerate(elements[:-1]))
+                return [spans.get(k) for k in 'iabcde']
+
+        return None
+
     def parse(self, string):
+        """
+        Parse the string into SpanQuestions that only record offsets into
+        the input string instead of copies of the stems and options.
+        """
         super(QuestParser, self).parse(string)
-        regex = self._format(r"({i}{w}{body})({a}{w}{body})({b}{w}{body})({c}{w}{body})({d}{w}{body})?({e}{w}{ebody})?{lb}")
 
         self._tokenize(string)
-        for token in [t.strip() for t in self._tokens if t]:
-            question = Question()
-            match = re.search(regex, token, re.DOTALL | re.IGNORECASE)
-            if match:
-                question.stem = match.group(1).strip()
-                question.options.append(match.group(2).strip())
-                question.options.append(match.group(3).strip())
-                question.options.append(match.group(4).strip())
-                if match.group(5): question.options.append(match.group(5).strip())
-                if match.group(6): question.options.append(match.group(6).strip())
-                self._questions.append(question)
+        for start, end in self._spans:
+            start, end = _strip(string, start, end)
+            if start < end:
+                spans = self._group_spans(string, start, end)
+                if spans:
+                    spans = [_strip(string, *span) for span in spans if span]
+                    self._questions.append(SpanQuestion(string, spans))
 
         return self
 
+def _strip(string, start, end):
+    """
+    The offsets of string[start:end].strip() into the string, without
+    copying the slice.
+
+    >>> _strip('  foo bar \\n', 0, 11)
+    (2, 9)
+    """
+    while start < end and string[start].isspace():
+        start += 1
+    while end > start and string[end-1].isspace():
+        end -= 1
+
+    return start, end
+
+########################################################################
+class _QuestScanner(object):
+    """
+    The quest scanner matches the QuestParser question structure::
+
+        index body A body B body C body [D body] [E ebody] terminal
+
+    by jumping from one marker to the next instead of extending the lazy
+    bodies one character at a time.  The markers are tried in the same
+    order as the regex tries them, including the shorter whitespace after
+    a marker, and every result is remembered so no stretch of the input
+    is matched twice.  The terminal is the next stem index for the _quest()
+    tokenizer, otherwise it is a double line-break or the end of input.
+
+    >>> p = QuestParser()
+    >>> s = _QuestScanner(p, '1. Stem? A. one B. two C. three 2. Next', lookahead=True)
+    >>> s.match(0)
+    [('i', 0), ('a', 9), ('b', 16), ('c', 23), ('t', 32)]
+    """
+    follows = {
+        'i': ('a',),
+        'a': ('b',),
+        'b': ('c',),
+        'c': ('d', 'e', 't'),
+        'd': ('e', 't'),
+        'e': ('t',),
+        }
+
+    def __init__(self, parser, string, lookahead, end=None):
+        flags = re.DOTALL | re.IGNORECASE
+        self.string = string
+        self.lookahead = lookahead
+        self.end = len(string) if end is None else end
+        self.rstrip = _strip(string, 0, self.end)[1]
+        self.index = re.compile(parser._format(r"({i})({w})"), flags)
+        self.markers = {
+            'i': self.index,
+            'a': re.compile(parser._format(r"({a})({w})"), flags),
+            'b': re.compile(parser._format(r"({b})({w})"), flags),
+            'c': re.compile(parser._format(r"({c})({w})"), flags),
+            'd': re.compile(parser._format(r"({d})({w})"), flags),
+            'e': re.compile(parser._format(r"({e})({w})"), flags),
+            }
+        self._found = {}
+        self._matched = {}
+        self._bodies = {}
+
+    def match(self, pos):
+        """
+        Match a whole question starting with the stem index at pos.
+
+        @param  int  pos  The position of the stem index
+        @return  list  The (kind, position) of each element, None if no match
+        """
+        return self._element('i', pos)
+
+    def _next(self, kind, pos):
+        """
+        The position of the first marker of kind at or after pos.  The
+        last search for each kind is remembered so that a search is never
+        repeated over input that has already been scanned.
+        """
+        if kind == 't' and self.lookahead:
+            kind = 'i'
+
+        lo, hi = self._found.get(kind, (None, None))
+        if lo is not None and lo <= pos and (hi is None or pos <= hi):
+            return hi
+
+        if kind == 't':
+            found = self.string.find('\n\n', pos, self.rstrip)
+            hi = found if found >= 0 else max(pos, self.rstrip)
+            hi = hi if hi <= self.end else None
+        else:
+            match = self.markers[kind].search(self.string, pos, self.end)
+            hi = match.start() if match else None
+        self._found[kind] = (pos, hi)
+
+        return hi
+
+    def _element(self, kind, pos):
+        """
+        Match the marker of kind at pos, with the greedy whitespace first,
+        followed by its body and the rest of the question.
+        """
+        if (kind, pos) in self._matched:
+            return self._matched[(kind, pos)]
+
+        elements = None
+        if kind == 't':
+            elements = [(kind, pos)]
+        else:
+            match = self.markers[kind].match(self.string, pos, self.end)
+            if match:
+                minimum = 0 if kind == 'e' else 1
+                for body in xrange(match.end(2), match.end(1), -1):
+                    rest = self._body(kind, body + minimum)
+                    if rest:
+                        elements = [(kind, pos)] + rest
+                        break
+
+        self._matched[(kind, pos)] = elements
+        return elements
+
+    def _body(self, kind, pos):
+        """
+        Extend the body of the element of kind to the first position at or
+        after pos where one of the following elements matches.
+        """
+        tried = []
+        elements = None
+
+        while True:
+            found = [(self._next(k, pos), n, k) for n, k in enumerate(self.follows[kind])]
+            found = sorted(f for f in found if f[0] is not None)
+            if not found:
+                break
+            at = found[0][0]
+            if (kind, at) in self._bodies:
+                elements = self._bodies[(kind, at)]
+                break
+            tried.append(at)
+            for k in (k for position, n, k in found if position == at):
+                elements = self._element(k, at)
+                if elements:
+                    break
+            if elements:
+                break
+            pos = at + 1
+
+        for at in tried:
+            self._bodies[(kind, at)] = elements
+
+        return elements
+
 ########################################################################
 class StemsParser (Parser):
     """
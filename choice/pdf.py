@@ -0,0 +1,186 @@
+"""
+The PDF module runs the pdftotext converter and reads its output one page
+at a time as it is written, instead of all at once, with the converter's
+warnings kept apart from the text.
+"""
+import os
+import tempfile
+
+from subprocess import Popen, PIPE
+
+########################################################################
+class PageReader(object):
+    """
+    The page reader runs the converter command line and reads its standard
+    output as it arrives, pdftotext ending each page with a form-feed, so
+    the pages can be worked on while the rest of the PDF is converted.  The
+    standard error goes to a temporary file so that warnings never end up
+    in the text and a full stderr pipe cannot block the converter.
+
+    If given a tee file all the output is also copied into it.
+
+    >>> r = PageReader(['printf', 'one\\\\ftwo\\\\f'])
+    >>> list(r.pages())
+    ['one\\x0c', 'two\\x0c']
+    >>> r.close()
+    ''
+    >>> r = PageReader(['ls', '/nonexistent'])
+    >>> list(r.pages())
+    []
+    >>> r.close()
+    Traceback (most recent call last):
+    OSError: The program ls failed: ...
+    """
+    blocksize = 1 << 16
+
+    def __init__(self, command_line, tee=None):
+        self.command_line = command_line
+        self.tee    = tee
+        self.stderr = tempfile.TemporaryFile()
+        self.proc   = Popen(command_line, stdout=PIPE, stderr=self.stderr)
+
+    def pages(self):
+        """
+        Yield the pages as the converter writes them, each page keeping its
+        form-feed so that the pages join up to the very same text.
+
+        @return  generator  The pages
+        """
+        fd = self.proc.stdout.fileno()
+        page = ''
+        while True:
+            block = os.read(fd, self.blocksize)
+            if not block:
+                break
+            if self.tee:
+                self.tee.write(block)
+
+            page += block
+            while '\f' in page:
+                cut = page.index('\f') + 1
+                yield page[:cut]
+                page = page[cut:]
+
+        if page:
+            yield page
+
+    def close(self):
+        """
+        Wait for the converter to finish and return its warnings.
+
+        @return  string  The standard error of the converter
+        """
+        self.proc.stdout.close()
+        returncode = self.proc.wait()
+
+        self.stderr.seek(0)
+        err = self.stderr.read()
+        self.stderr.close()
+
+        if returncode:
+            raise OSError, 'The program %s failed: %s' % (self.command_line[0], err.strip())
+
+        return err
+
+    def abort(self):
+        """
+        Kill the converter when its pages are no longer wanted and wait for
+        it so that it does not linger.
+
+        >>> r = PageReader(['sh', '-c', 'printf "one\\\\f"; exec sleep 60'])
+        >>> next(r.pages())
+        'one\\x0c'
+        >>> r.abort()
+        >>> r.proc.returncode
+        -9
+        """
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+        self.stderr.close()
+
+########################################################################
+class PageFile(object):
+    """
+    The page file is a file-like object over the pages for Parser.windows()
+    whose reads are only short at the end of the pages.
+
+    >>> f = PageFile(iter(['one\\f', 'two\\f']))
+    >>> f.read(5), f.read(5), f.read(5)
+    ('one\\x0ct', 'wo\\x0c', '')
+    """
+    def __init__(self, pages):
+        self._pages  = pages
+        self._buffer = ''
+
+    def read(self, size=-1):
+        """
+        Read size bytes, the whole of the rest if negative, from the pages.
+
+        @param  int  size  The number of bytes to read
+        @return  string  The bytes read, short only at the end
+        """
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._pages)
+            except StopIteration:
+                break
+
+        if size < 0:
+            size = len(self._buffer)
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+########################################################################
+def page_count(path):
+    """
+    The number of pages in the PDF as told by pdfinfo.
+
+    @param  string  path  The PDF file path
+    @return  int  The page count
+    """
+    proc = Popen(['pdfinfo', path], stdout=PIPE, stderr=PIPE)
+    out, err = proc.communicate()
+    for line in out.splitlines():
+        if line.startswith('Pages:'):
+            return int(line.split()[1])
+
+    raise OSError, 'The program pdfinfo failed: %s' % err.strip()
+
+def page_ranges(count, parts):
+    """
+    Split the pages into at most parts contiguous (first, last) ranges of
+    about the same size.
+
+    @param  int  count  The page count
+    @param  int  parts  The number of ranges
+    @return  list  The page ranges, first page is 1
+
+    >>> page_ranges(10, 3)
+    [(1, 3), (4, 6), (7, 10)]
+    >>> page_ranges(2, 4)
+    [(1, 1), (2, 2)]
+    """
+    parts = max(1, min(parts, count))
+    ranges = []
+    first = 1
+    for part in xrange(parts):
+        last = first + (count - first + 1) // (parts - part) - 1
+        ranges.append((first, last))
+        first = last + 1
+
+    return ranges
+
+def convert(command_line):
+    """
+    Process pool worker that runs one converter command line, a page range
+    of the PDF, and returns its output and warnings.
+
+    @param  list  command_line  The converter command line
+    @return  tuple  The standard output, standard error and exit status
+    """
+    proc = Popen(command_line, stdout=PIPE, stderr=PIPE)
+    out, err = proc.communicate()
+    return out, err, proc.returncode
@@ -0,0 +1,121 @@
+"""
+The pipeline overlaps the reading and PDF conversion of many input files
+with their parsing: a pool of converter threads waits on the files and the
+pdftotext processes while a pool of worker processes parses the converted
+text, so the CPU is not left idle while each pdftotext runs.
+"""
+import sys
+import time
+import Queue
+import threading
+
+from StringIO             import StringIO
+from multiprocessing      import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+
+from router import Router
+
+########################################################################
+def _convert(args):
+    """
+    Converter thread worker that reads one input file, converting it if it
+    is a PDF, once there is room in the pipeline.
+
+    @param  tuple  args  The pipeline, the input path and the router options
+    @return  tuple  The input path, the input strings, seconds and error
+    """
+    pipeline, inputpath, options = args
+    pipeline.room.acquire()
+    start = time.time()
+    try:
+        router = Router()
+        router.setup(options)
+        with open(inputpath, 'rU') as inputfile:
+            strings = router.get_input(inputfile)
+        return inputpath, strings, time.time() - start, None
+
+    except (Exception, SystemExit):
+        pipeline.room.release()
+        return inputpath, None, time.time() - start, str(sys.exc_info()[1])
+
+def _parse(args):
+    """
+    Process pool worker that runs the converted input strings thru the
+    router: mogrify, parse, filter and write.
+
+    @param  tuple  args  The input path, router options, strings and seconds
+    @return  tuple  The input path, writer output, question count, seconds
+                    and error
+    """
+    inputpath, options, strings, seconds = args
+    start = time.time()
+    try:
+        router = Router()
+        router.setup(options)
+        router.options.input = strings
+        router._load()
+        output = StringIO()
+        router.options.outputfile = output
+        router.write()
+        return inputpath, output.getvalue(), len(router.questions), seconds + time.time() - start, None
+
+    except (Exception, SystemExit):
+        return inputpath, None, 0, seconds + time.time() - start, str(sys.exc_info()[1])
+
+########################################################################
+class Pipeline(object):
+    """
+    The pipeline runs the input files thru the converters and the parse
+    workers, at most ``limit`` files being converted or waiting to be
+    parsed at any one time so that the converted text does not pile up.
+
+    >>> p = Pipeline(['-w', 'JsonWriter'], converters=2, workers=2)
+    >>> sorted((r[0], r[2], r[4]) for r in p.run(['input/reading', 'input/drivers', 'input/none']))
+    [('input/drivers', 11, None), ('input/none', 0, "[Errno 2] No such file or directory: 'input/none'"), ('input/reading', 15, None)]
+    """
+
+    def __init__(self, options=(), converters=4, workers=None, limit=None):
+        self.options    = list(options)
+        self.converters = converters
+        self.workers    = workers or cpu_count()
+        self.room       = threading.BoundedSemaphore(limit or self.converters + 2 * self.workers)
+
+    def run(self, inputpaths):
+        """
+        Run the input files thru the pipeline.
+
+        @param  list  inputpaths  The input file paths
+        @return  generator  The (input path, writer output, question count,
+                            seconds, error) results as they complete
+        """
+        inputpaths = list(inputpaths)
+        results = Queue.Queue()
+        threads = ThreadPool(self.converters)
+        pool = Pool(self.workers)
+
+        def parsed(result):
+            self.room.release()
+            results.put(result)
+
+        def feed():
+            tasks = [(self, p, self.options) for p in inputpaths]
+            for inputpath, strings, seconds, error in threads.imap_unordered(_convert, tasks):
+                if error:
+                    results.put((inputpath, None, 0, seconds, error))
+                else:
+                    pool.apply_async(_parse, ((inputpath, self.options, strings, seconds),), callback=parsed)
+
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.start()
+
+        try:
+            for i in xrange(len(inputpaths)):
+                yield results.get()
+
+        finally:
+            feeder.join()
+            threads.close()
+            pool.close()
+            threads.join()
+            pool.join()
@@ -1,14 +1,24 @@
 
 import re
 
+from array import array
+
 class Question(object):
     """
     A question is composed of a stem and a list of options.
     """
+    __slots__ = ('stem', 'options')
+
     def __init__(self):
         self.stem = ''
         self.options = []
 
+    def __getstate__(self):
+        return (self.stem, self.options)
+
+    def __setstate__(self, state):
+        self.stem, self.options = state
+
     def __str__(self):
         return '%-72s %4d byte stem,%2d options' % (self.stem[0:72], len(self.stem), len(self.options))
 
@@ -16,6 +26,64 @@ class Question(object):
         count = len(self.options)
         return True if count > 1 and count < 11 else False
 
+class SpanQuestion(Question):
+    """
+    A span question records its stem and options as (start, end) offsets
+    into the input buffer and only creates the strings when they are read.
+    The options are made into a list the first time they are read, which is
+    then kept, so that a span question can be changed like any question.
+
+    >>> q = SpanQuestion('1. Stem? a. one b. two', [(0, 8), (9, 15), (16, 22)])
+    >>> q.stem, q.options
+    ('1. Stem?', ['a. one', 'b. two'])
+    >>> q.is_valid()
+    True
+    >>> q.options.append('c. three'); q.stem = '2. Stem?'
+    >>> q.stem, q.options, q.is_valid()
+    ('2. Stem?', ['a. one', 'b. two', 'c. three'], True)
+    """
+    __slots__ = ('buffer', 'spans', '_stem', '_options')
+
+    def __init__(self, buffer, spans):
+        self.buffer   = buffer
+        self.spans    = array('l', (offset for span in spans for offset in span))
+        self._stem    = None
+        self._options = None
+
+    def __getstate__(self):
+        # the buffer is shared, and so only pickled once, by all the
+        # questions of a parse
+        return (self.buffer, self.spans.tolist(), self._stem, self._options)
+
+    def __setstate__(self, state):
+        self.buffer   = state[0]
+        self.spans    = array('l', state[1])
+        self._stem, self._options = state[2:] if len(state) > 2 else (None, None)
+
+    @property
+    def stem(self):
+        if self._stem is not None:
+            return self._stem
+        return self.buffer[self.spans[0]:self.spans[1]]
+
+    @stem.setter
+    def stem(self, stem):
+        self._stem = stem
+
+    @property
+    def options(self):
+        if self._options is None:
+            self._options = [self.buffer[self.spans[n]:self.spans[n+1]] for n in range(2, len(self.spans), 2)]
+        return self._options
+
+    @options.setter
+    def options(self, options):
+        self._options = options
+
+    def is_valid(self):
+        count = len(self.spans) // 2 - 1 if self._options is None else len(self._options)
+        return True if count > 1 and count < 11 else False
+
 class Questions(object):
     """
     A Questions is a list of Question objects.
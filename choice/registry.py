@@ -0,0 +1,55 @@
+"""
+The registry maps the parser, mogrifyer, filter and writer class names
+given on the command-line to their classes, importing each module only
+when one of its classes is first asked for.
+"""
+import sys
+
+########################################################################
+class Registry(object):
+    """
+    The registry resolves a class name within one of the choice modules
+    and keeps it so that it is only looked up once per process.
+
+    >>> r = Registry()
+    >>> r.get('parser', 'IndexParser')
+    <class '...parser.IndexParser'>
+    >>> r.get('parser', 'IndexParser') is r.get('parser', 'IndexParser')
+    True
+    >>> r.get('parser', 'NoParser')
+    Traceback (most recent call last):
+    AttributeError: 'module' object has no attribute 'NoParser'
+    """
+    modules = ('parser', 'mogrifyer', 'filter', 'writer')
+
+    def __init__(self):
+        self.classes = {}
+
+    def get(self, modname, classname):
+        """
+        Return the class "classname" from the choice module "modname".
+        reposted by ben snider
+            from http://mail.python.org/pipermail/python-list/2003-March/192221.html
+              on http://www.bensnider.com/2008/02/27/dynamically-import-and-instantiate-python-classes/
+
+        @param  string  modname  The module: parser, mogrifyer, filter or writer
+        @param  string  classname  The class name
+        @return  class  The class
+        """
+        try:
+            return self.classes[modname, classname]
+
+        except KeyError:
+            # inject the caller's context in not from our choice module
+            module = modname
+            if __name__ != 'registry': # choice.registry
+                module = __name__.replace('registry', modname) # choice.MODNAME
+
+            __import__(module)
+            classobj = getattr(sys.modules[module], classname)
+            self.classes[modname, classname] = classobj
+
+            return classobj
+
+# the one registry of the process
+registry = Registry()
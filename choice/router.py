@@ -1,13 +1,26 @@
 
 import sys
 import pprint
+import cPickle
 import argparse
 
-from subprocess import Popen, PIPE, STDOUT
-from os         import path
+from os              import path
+from multiprocessing import Pool, cpu_count
+
+from StringIO        import StringIO
 
 from question import Question
 from question import Questions
+from parser   import Parser
+from parser   import SingleParser
+from parser   import MappedFile
+from cache    import Cache
+from cache    import ResultCache
+from incremental import State
+from registry import registry
+from pdf      import PageReader
+from pdf      import PageFile
+from pdf      import page_count, page_ranges, convert
 
 try:
     from pyPdf import PdfFileReader # external library
@@ -15,6 +28,54 @@ try:
 except ImportError:
     PdfFileReader = None
 
+########################################################################
+def _run_parser(args):
+    """
+    Process pool worker for Router._run_parsers() that runs one parser
+    class over the input strings.
+
+    @param  tuple  args  The parser class name and the input strings
+    @return  parser.Parser  The parsed parser, None if the input overflowed
+    """
+    parserclass, strings = args
+    parser = getattr(sys.modules[Parser.__module__], parserclass)()
+    try:
+        for string in strings:
+            parser.parse(string)
+    except OverflowError:
+        return None
+
+    return parser
+
+########################################################################
+class OutputTee(object):
+    """
+    The output tee passes the writer output on to the output file and keeps
+    a copy of it for the result cache.
+
+    >>> t = OutputTee(StringIO())
+    >>> t.writelines(('one', '\\n')); t.write('two'); t.flush()
+    >>> t.getvalue()
+    'one\\ntwo'
+    """
+    def __init__(self, outputfile):
+        self.outputfile = outputfile
+        self.copy = StringIO()
+
+    def write(self, string):
+        self.outputfile.write(string)
+        self.copy.write(string)
+
+    def writelines(self, strings):
+        for string in strings:
+            self.write(string)
+
+    def flush(self):
+        self.outputfile.flush()
+
+    def getvalue(self):
+        return self.copy.getvalue()
+
 ########################################################################
 class Router(object):
     """
@@ -33,12 +94,27 @@ class Router(object):
                 <show stats>
 
             write()
+
+    With the --stream option load() instead sets the questions to the
+    _stream() generator which is then consumed by write() one window of
+    input at a time.
+
+    With the --incremental option load() parses only the question blocks
+    that changed since the last run and carries the other questions over.
+
+    Otherwise load() first looks up the input and the options in the
+    result cache and on a hit takes the questions, the writer output and
+    the parser results of the earlier run from it, skipping the mogrifying,
+    parsing and filtering, and write() then just writes the output.  On a
+    miss write() stores them.
     """
 
     # Properties
     # ------------------------------------------------------------------
 
     version = '0.1'
+    _command_line = None
+    _results = None
     develenv = 'Python 2.7.1+ (r271:86832, Apr 11 2011, 18:05:24) [GCC 4.5.2] on linux2'
 
     # Constructor
@@ -47,11 +123,16 @@ class Router(object):
     def __init__(self):
         self.questions = []
         self.qhash     = {}
+        self.shash     = {}
+        self.pool      = None
         self.options   = None
         self.parser    = None
         self.converter = None
         self.mogrifyers= []
         self.filters   = []
+        self.result_key= None
+        self.output    = None
+        self.incremental = None
         self.PrettyPrinter = pprint.PrettyPrinter(indent=4, width=72)
         self.setup([])
 
@@ -69,7 +150,10 @@ class Router(object):
 %s
 input: %s, %s, mode %s,%s encoding %s, newlines %s
 converter: %s
+results: %s
+incremental: %s
 %s
+sample: %s
 mogrifyers: %s
 filters: %s
 parser: %s
@@ -91,8 +175,12 @@ tokens: %s
             repr(infile.newlines),
 # converter
             f(self.converter),
+# result cache
+            str(self._results),
+            'parsed %d of %d blocks' % self.incremental if self.incremental else None,
 # qhash & formatters
             f(self.qhash),
+            f(self.shash),
             f(self.mogrifyers),
             f(self.filters),
 # parser
@@ -119,50 +207,25 @@ tokens: %s
         >>> r.options
         Namespace... qualify=True...
         """
-        # declare command-line argument parser
-        command_line = argparse.ArgumentParser(
-            description='Parses and tokenizes text.',
-            epilog='Refer to the documentation for more detailed information.',
-            prog=sys.argv[0],
-            )
-
-        # define the command-line arguments
-        command_line.add_argument('-V', '--version', action='version',
-                            version='%(prog)s Router version ' + self.version + ' developed with ' + self.develenv,
-                            help='print the version information and exit')
+        command_line = self._get_command_line()
 
-        command_line.add_argument('-s', '--stats', nargs='?', metavar='SLVL',
-                            type=int, default=0, const=1,
-                            help='stats print level: 1, 2, 3, 4, 5 (5=most)')
-
-        command_line.add_argument('-q', '--qualify', action='store_true',
-                            help='Qualify the output with the question parts') # e.g. "stem = ...."
-
-        command_line.add_argument('-i', dest='inputfile', nargs='?', metavar='INFL',
-                            type=argparse.FileType('rU'), default=sys.stdin,
-                            help='input filename, def=stdin')
-
-        command_line.add_argument('-o', dest='outputfile', metavar='OUFL', nargs='?',
-                            type=argparse.FileType('w'), default=sys.stdout, const='/dev/null',
-                            help='output filename, def=stdout, const=/dev/null')
-
-        command_line.add_argument('-m', dest='mogrifyers', type=str, metavar='MGRFs',
-                            help='mogrifyer classes "M1, M2,... Mn"')
-
-        command_line.add_argument('-p', dest='parser', type=str, metavar='PRSR',
-                            help='parser class')
+        # load the commandline options
+        self.options = command_line.parse_args(options)
 
-        command_line.add_argument('-f', dest='filters', type=str, metavar='FLTRs',
-                            help='filterer classes "F1, F2,... Fn"')
+        # the standard streams are looked up now as the parser is shared
+        self.options.inputfile  = self.options.inputfile  or sys.stdin
+        self.options.outputfile = self.options.outputfile or sys.stdout
 
-        command_line.add_argument('-w', dest='writer', type=str, metavar='WRTR',
-                            help='writer class')
+        # the streamed questions are never held so there are no stats and
+        # windows over maxlen would be rejected by the parsers.
+        if self.options.stream and self.options.stats:
+            command_line.error('argument -s/--stats: not allowed with argument --stream')
 
-        command_line.add_argument('input', metavar='INPUT', type=str, nargs='?',
-                            help='input string')
+        if self.options.stream and self.options.incremental:
+            command_line.error('argument --incremental: not allowed with argument --stream')
 
-        # load the commandline options
-        self.options = command_line.parse_args(options)
+        if self.options.stream > Parser.maxlen:
+            command_line.error('argument --stream: SIZE must be at most %d' % Parser.maxlen)
 
         # 'foo , bar' ==>> ['foo', 'bar']
         self.options.filters    = [f.strip() for f in self.options.filters.split(',')   ] if self.options.filters    else []
@@ -186,12 +249,7 @@ tokens: %s
             pass
 
         else:
-            self.parse (self.mogrify (self.get_input ()))
-
-            self.filter()
-
-            if self.options.stats:
-                print self
+            self._load()
 
     def start(self, options=sys.argv[1:]):
         """
@@ -225,15 +283,9 @@ tokens: %s
         This is the stem
         a. This is an option
         """
-        self.mogrifyers = list(self._get_mogrifyers())
-
-        new_strings = []
-        for string in strings:
-            for mogrifyer in self.mogrifyers:
-                string = mogrifyer.mogrify(string)
-            new_strings.append(string)
+        self.mogrifyers = self._get_mogrifyer_chain()
 
-        return new_strings
+        return [self.mogrifyers.mogrify(string) for string in strings]
 
     def parse(self, strings):
         """
@@ -242,8 +294,9 @@ tokens: %s
         and object instance for us which we run the parse() method on to
         retrieve our question list which we load into ourself.
 
-        ..note: This is doing double work if get_parser() is running all
-        the parsers.
+        When the parser is auto-detected _get_parser() has already run it
+        over the input so its questions are used as is instead of parsing
+        the input a second time.
 
         @param  list  strings  The input strings, possibly mogrified
 
@@ -255,10 +308,11 @@ tokens: %s
         This is the stem
         """
         try:
-            self.parser = self._get_parser(strings)
+            self.parser, parsed = self._get_parser(strings)
             #~ import pdb; pdb.set_trace()
-            for string in strings:
-                self.parser.parse(string)
+            if not parsed:
+                for string in strings:
+                    self.parser.parse(string)
 
             self.questions.extend(self.parser.questions)
 
@@ -281,10 +335,17 @@ tokens: %s
         """
         self.filters = list(self._get_filters())
 
-        for filter in self.filters:
-            self.questions = filter.filter(self.questions)
+        # the router owns its questions so they are filtered in place
+        if self.filters:
+            FilterChain = self.__forname("filter", 'FilterChain')
+            self.questions = list(FilterChain(self.filters, inplace=True).filter(self.questions))
 
     def write(self):
+        # a result cache hit has the output already
+        if self.output is not None:
+            self.options.outputfile.write(self.output)
+            return
+
         try:
             writer = self._get_writer()
 
@@ -294,7 +355,14 @@ tokens: %s
             sys.stderr.write('\n')
 
         else:
-            writer.write(self.options.outputfile, self.questions)
+            if not self.result_key:
+                writer.write(self.options.outputfile, self.questions)
+                return
+
+            tee = OutputTee(self.options.outputfile)
+            writer.write(tee, self.questions)
+            result = (self.questions, tee.getvalue(), self.qhash, self.shash)
+            self._results.put(self.result_key, cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL))
 
         #finally:
             #self.options.outputfile.close() # only close if not stdout
@@ -344,6 +412,266 @@ tokens: %s
 
         return inputfile.read()
 
+    def _load(self):
+        """
+        The load() after the setup(): mogrifying, parsing and filtering.
+        """
+        if self.options.stream:
+            self.questions = self._stream()
+            return
+
+        strings = self.get_input()
+
+        if self.options.incremental:
+            self._incremental(strings)
+            if self.options.stats:
+                print self
+            return
+
+        # only a fresh router can take its questions from the result cache
+        results = self._get_results() if not self.questions else None
+        if results:
+            self.result_key = results.key(strings, self._get_configuration())
+            result = results.get(self.result_key)
+            if result is not None:
+                # the parser results too, as shown by matrix_app and the stats
+                self.questions, self.output, self.qhash, self.shash = cPickle.loads(result)
+                self.result_key = None
+                if self.options.stats:
+                    print self
+                return
+
+        self.parse (self.mogrify (strings))
+        self._close_pool()
+
+        self.filter()
+
+        if self.options.stats:
+            print self
+
+    def _stream(self):
+        """
+        Run the input thru the mogrifiers, parser and filters one bounded
+        window at a time yielding the questions as they are parsed.  The
+        parser is auto-detected, if not specified, on the first window that
+        does not fall back to the SingleParser and then reused for the rest
+        of the windows.
+
+        @return  generator  The filtered questions
+
+        >>> r = Router()
+        >>> r.setup(['--stream', '40', '-f', 'IndexFilter', '''1. One?
+        ... a. yes
+        ... b. no
+        ...
+        ... 2. Two?
+        ... a. yes
+        ... b. no'''])
+        >>> [q.stem for q in r._stream()]
+        [' One?', ' Two?']
+        """
+        if self.options.input:
+            inputfile = StringIO(self.options.input)
+        elif '.pdf' == self.options.inputfile.name[-4:]:
+            inputfile = PageFile(self._get_pdf_pages(self.options.inputfile))
+        else:
+            inputfile = self._map(self.options.inputfile)
+
+        self.mogrifyers = self._get_mogrifyer_chain()
+        self.filters = list(self._get_filters())
+        chain = self.__forname("filter", 'FilterChain')(self.filters, inplace=True) if self.filters else None
+        ParserClass = None
+
+        for window in Parser().windows(inputfile, self.options.stream):
+            window = self.mogrifyers.mogrify(window)
+
+            if ParserClass in (None, SingleParser):
+                self.parser, parsed = self._get_parser([window])
+                ParserClass = self.parser.__class__
+            else:
+                self.parser, parsed = ParserClass(), False
+
+            try:
+                if not parsed:
+                    self.parser.parse(window)
+
+            except (AttributeError, OverflowError):
+                self.__error(("Could not parse input.", self.parser, sys.exc_info()[1]))
+                continue
+
+            questions = self.parser.questions
+            if chain:
+                questions = chain.filter(questions)
+
+            for question in questions:
+                yield question
+
+        self._close_pool()
+
+    def _incremental(self, strings):
+        """
+        Parse the input again only where its question blocks changed since
+        the last run with the --incremental state file, the questions of
+        the unchanged blocks being carried over from the state.  The first
+        run, and a run with other options, is a full parse that is checked
+        against the blocks, and a document whose blocks do not parse as the
+        whole does is always parsed in full.  So is, and checked again, an
+        edit that moves the block boundaries, changes the question count of
+        a block or makes another parser the detected one.
+
+        @param  list  strings  The input strings
+
+        >>> import os, shutil, tempfile
+        >>> statepath = os.path.join(tempfile.mkdtemp(), 'state')
+        >>> text = '1. One?\\na. yes\\nb. no\\n\\n2. Two?\\na. yes\\nb. no\\n'
+        >>> r = Router()
+        >>> r.setup(['--incremental', statepath, text])
+        >>> r._incremental([text])
+        >>> [q.stem for q in r.questions], r.incremental
+        (['1. One?', '2. Two?'], (2, 2))
+        >>> r = Router()
+        >>> r.setup(['--incremental', statepath, text])
+        >>> r._incremental([text.replace('Two', 'Three')])
+        >>> [q.stem for q in r.questions], r.incremental
+        (['1. One?', '2. Three?'], (1, 2))
+        >>> r = Router()
+        >>> r.setup(['--incremental', statepath, text])
+        >>> r._incremental([text.replace('\\n\\n', '\\n')])
+        >>> [q.stem for q in r.questions], r.incremental
+        (['1. One?', '2. Two?'], (2, 2))
+        >>> shutil.rmtree(os.path.dirname(statepath))
+        """
+        state = State(self.options.incremental)
+        configuration = [ResultCache.fingerprint()] + self._get_configuration()
+        known = state.load(configuration)
+        text = ''.join(strings)
+
+        blocks = None
+        if state.blockwise:
+            ParserClass = self.__forname("parser", state.parser)
+            blocks = self._parse_blocks(state, text, ParserClass, known)
+            if not self._same_blocks(state, blocks, known) or \
+                    (self.incremental[0] and self._detect_parser(strings) is not ParserClass):
+                blocks = None
+
+        if blocks is not None:
+            self.parser = ParserClass()
+            self.questions = [q for digest, offset, questions in blocks for q in questions]
+            blockwise = True
+
+        else:
+            self.parse (self.mogrify (strings))
+            self._close_pool()
+            self.filter()
+
+            # a state that is not blockwise has been checked already
+            if (state.parser and not state.blockwise) or not self.parser:
+                return
+
+            ParserClass = self.parser.__class__
+            blocks = self._parse_blocks(state, text, ParserClass, {})
+            blockwise = [(q.stem, list(q.options)) for q in self.questions] == \
+                        [(q.stem, list(q.options)) for digest, offset, questions in blocks for q in questions]
+
+        # an unchanged document needs no new state
+        if blocks != state.blocks or not state.blockwise:
+            state.update(configuration, ParserClass.__name__, blockwise, blocks)
+            state.save()
+
+    def _same_blocks(self, state, blocks, known):
+        """
+        Whether the blocks are those of the state but for the contents of
+        the changed ones, each of which still has the question count of the
+        block it replaces, so that the questions of the unchanged blocks can
+        be trusted to be what a full parse gives.
+
+        @param  incremental.State  state  The incremental state
+        @param  list  blocks  The (digest, offset, questions) of each block
+        @param  dict  known  The questions of each known block digest
+        @return  bool  Whether the blocks still parse as the whole does
+        """
+        if len(blocks) != len(state.blocks):
+            return False
+
+        for (digest, offset, questions), old in zip(blocks, state.blocks):
+            if digest not in known and len(questions) != len(old[2]):
+                return False
+
+        return True
+
+    def _detect_parser(self, strings):
+        """
+        The parser class that a full parse of the strings would use.
+
+        @param  list  strings  The input strings
+        @return  class  The parser class
+        """
+        if self.options.parser:
+            return self.__forname("parser", self.options.parser)
+
+        parser = self._get_parser(self.mogrify(strings))[0]
+        self._close_pool()
+
+        return parser.__class__
+
+    def _parse_blocks(self, state, text, ParserClass, known):
+        """
+        Cut the text into question blocks and parse, mogrify and filter
+        each block that is not known.
+
+        @param  incremental.State  state  The incremental state
+        @param  string  text  The input text
+        @param  class  ParserClass  The parser class
+        @param  dict  known  The questions of each known block digest
+        @return  list  The (digest, offset, questions) of each block
+        """
+        self.mogrifyers = self._get_mogrifyer_chain()
+        self.filters = list(self._get_filters())
+        chain = self.__forname("filter", 'FilterChain')(self.filters, inplace=True) if self.filters else None
+
+        blocks = []
+        parsed = 0
+        for offset, block in ParserClass().blocks(text):
+            digest = state.digest(block)
+            questions = known.get(digest)
+            if questions is None:
+                questions = []
+                for window in Parser().windows(StringIO(block)):
+                    parser = ParserClass()
+                    try:
+                        parser.parse(self.mogrifyers.mogrify(window))
+                    except (AttributeError, OverflowError):
+                        self.__error(("Could not parse input.", parser, sys.exc_info()[1]))
+                        continue
+                    questions.extend(chain.filter(parser.questions) if chain else parser.questions)
+                parsed += 1
+
+            blocks.append((digest, offset, questions))
+
+        self.incremental = (parsed, len(blocks))
+
+        return blocks
+
+    def _map(self, inputfile):
+        """
+        Memory-map a plain text input file for the --stream windows so that
+        the window boundaries are found in the mapped file, falling back to
+        the file itself for standard input, empty files and files with
+        carriage returns which the universal newlines mode would convert.
+
+        @param  inputfile  File  The open input file object
+        @return  MappedFile  The mapped file, or the file itself
+        """
+        try:
+            mapped = MappedFile(inputfile)
+            if mapped.length and mapped.find('\r') == -1:
+                return mapped
+
+        except (ValueError, EnvironmentError):
+            pass
+
+        return inputfile
+
     def _get_pdf_contents(self, inputfile):
         # first try the pyPdf module
         #~ if PdfFileReader:
@@ -360,15 +688,260 @@ tokens: %s
                     #~ return contents
 
         # fallback to the pdftotext program
+        if self.options.pdf_jobs:
+            return self._get_pdf_ranges(inputfile)
+
+        return ''.join(self._get_pdf_pages(inputfile))
+
+    def _get_pdf_ranges(self, inputfile):
+        """
+        Convert the PDF with pdftotext in --pdf-jobs processes, one page
+        range each, and join the ranges up in page order into the same text
+        as a single run, so that a question running over the end of a range
+        is not split and a cache hit parses the same as a miss.
+
+        @param  inputfile  File  The open input file object
+        @return  string  The converted text
+        """
         command_line = ['pdftotext', '-raw', inputfile.name, '-']
         self.converter = command_line
-        proc = Popen(command_line, stdout=PIPE, stderr=STDOUT)
-        out, err = proc.communicate()
-        if err:
-            self.__error(err)
-            raise OSError, 'The program pdftotext was not found in the path.'
-        else:
-            return out
+
+        # the ranges join up to the same text as a single run so they
+        # share its cache entry
+        cache = self._get_cache()
+        if cache:
+            key = cache.key(inputfile.name, command_line[:-2])
+            contents = cache.get(key)
+            if contents is not None:
+                self.converter = ['cache', key] + command_line
+                return contents
+
+        ranges = page_ranges(page_count(inputfile.name), self.options.pdf_jobs)
+        command_lines = [command_line[:-2] + ['-f', str(f), '-l', str(l)] + command_line[-2:] for f, l in ranges]
+        self.converter = command_lines
+
+        pool = Pool(len(command_lines))
+        try:
+            results = pool.map(convert, command_lines, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        for out, err, returncode in results:
+            if returncode:
+                raise OSError, 'The program pdftotext failed: %s' % err.strip()
+            if err:
+                self.__error((err.strip(),))
+
+        contents = ''.join(out for out, err, returncode in results)
+        if cache:
+            cache.put(key, contents)
+
+        return contents
+
+    def _get_pdf_pages(self, inputfile):
+        """
+        Convert the PDF with pdftotext yielding its pages as they are
+        converted, or the cached conversion in blocks, so that the --stream
+        windows can be parsed while the rest of the PDF is converted.  The
+        pdftotext warnings are written to standard error, not the text.
+
+        @param  inputfile  File  The open input file object
+        @return  generator  The converted text
+        """
+        command_line = ['pdftotext', '-raw', inputfile.name, '-']
+        self.converter = command_line
+
+        # the cache is keyed by the PDF content and the converter options,
+        # not the file name, so that a renamed PDF is not converted again.
+        cache = self._get_cache()
+        if cache:
+            key = cache.key(inputfile.name, command_line[:-2])
+            cachefile = cache.open(key)
+            if cachefile:
+                self.converter = ['cache', key] + command_line
+                with cachefile:
+                    for block in iter(lambda: cachefile.read(PageReader.blocksize), ''):
+                        yield block
+                return
+
+        # the conversion is copied into the cache as it is read and only
+        # committed once pdftotext has succeeded
+        tee = cache.create() if cache else None
+        reader = None
+        try:
+            reader = PageReader(command_line, tee)
+            for page in reader.pages():
+                yield page
+            err, reader = reader.close(), None
+
+            if err:
+                self.__error((err.strip(),))
+
+            if tee:
+                tee.close()
+                cache.commit(key, tee)
+                tee = None
+
+        # a failed or abandoned conversion is killed and not cached
+        finally:
+            if reader:
+                reader.abort()
+            if tee:
+                cache.discard(tee)
+
+    @classmethod
+    def _get_command_line(cls):
+        """
+        The command-line argument parser, which is built only once per
+        process and then reused by every setup().
+        """
+        if cls._command_line:
+            return cls._command_line
+
+        # declare command-line argument parser
+        command_line = argparse.ArgumentParser(
+            description='Parses and tokenizes text.',
+            epilog='Refer to the documentation for more detailed information.',
+            prog=sys.argv[0],
+            )
+
+        # define the command-line arguments
+        command_line.add_argument('-V', '--version', action='version',
+                            version='%(prog)s Router version ' + cls.version + ' developed with ' + cls.develenv,
+                            help='print the version information and exit')
+
+        command_line.add_argument('-s', '--stats', nargs='?', metavar='SLVL',
+                            type=int, default=0, const=1,
+                            help='stats print level: 1, 2, 3, 4, 5 (5=most)')
+
+        command_line.add_argument('-q', '--qualify', action='store_true',
+                            help='Qualify the output with the question parts') # e.g. "stem = ...."
+
+        command_line.add_argument('-i', dest='inputfile', nargs='?', metavar='INFL',
+                            type=argparse.FileType('rU'), default=None,
+                            help='input filename, def=stdin')
+
+        command_line.add_argument('-o', dest='outputfile', metavar='OUFL', nargs='?',
+                            type=argparse.FileType('w'), default=None, const='/dev/null',
+                            help='output filename, def=stdout, const=/dev/null')
+
+        command_line.add_argument('-m', dest='mogrifyers', type=str, metavar='MGRFs',
+                            help='mogrifyer classes "M1, M2,... Mn"')
+
+        command_line.add_argument('-p', dest='parser', type=str, metavar='PRSR',
+                            help='parser class')
+
+        command_line.add_argument('-f', dest='filters', type=str, metavar='FLTRs',
+                            help='filterer classes "F1, F2,... Fn"')
+
+        command_line.add_argument('-w', dest='writer', type=str, metavar='WRTR',
+                            help='writer class')
+
+        command_line.add_argument('--stream', nargs='?', metavar='SIZE',
+                            type=int, default=0, const=Parser.maxlen,
+                            help='parse and write the input in windows of SIZE bytes, const=%d' % Parser.maxlen)
+
+        command_line.add_argument('--sample', nargs='?', metavar='SIZE',
+                            type=int, default=0, const=10000,
+                            help='auto-detect the parser on the first SIZE bytes of input, const=10000')
+
+        command_line.add_argument('-j', '--jobs', nargs='?', metavar='JOBS',
+                            type=int, default=0, const=cpu_count(),
+                            help='auto-detect the parser with JOBS processes, const=%d' % cpu_count())
+
+        command_line.add_argument('--pdf-jobs', nargs='?', metavar='JOBS',
+                            type=int, default=0, const=cpu_count(),
+                            help='convert PDF page ranges with JOBS processes, const=%d' % cpu_count())
+
+        command_line.add_argument('--incremental', metavar='STATE', type=str,
+                            help='parse only the question blocks changed since the run that saved the STATE file')
+
+        command_line.add_argument('--cache-dir', metavar='DIR', type=str,
+                            default=path.join(path.expanduser('~'), '.cache', 'choice'),
+                            help='PDF conversion and result cache directory, def=~/.cache/choice')
+
+        command_line.add_argument('--cache', action='store_true',
+                            help='keep the results in the result cache and answer from it')
+
+        command_line.add_argument('--cache-size', metavar='MB', type=int, default=256,
+                            help='PDF conversion and result cache size limits in megabytes, def=256')
+
+        command_line.add_argument('--no-cache', action='store_true',
+                            help='bypass the PDF conversion and result caches')
+
+        command_line.add_argument('input', metavar='INPUT', type=str, nargs='?',
+                            help='input string')
+
+        cls._command_line = command_line
+
+        return command_line
+
+    def _get_cache(self):
+        """
+        The PDF conversion cache, unless bypassed with --no-cache.
+
+        >>> r = Router()
+        >>> r.setup(['--cache-dir', '/tmp/choice', '--cache-size', '1'])
+        >>> r._get_cache().directory, r._get_cache().limit
+        ('/tmp/choice', 1048576)
+        >>> r.setup(['--no-cache'])
+        >>> r._get_cache()
+        """
+        if self.options.no_cache or self.options.cache_size <= 0:
+            return None
+
+        return Cache(self.options.cache_dir, self.options.cache_size * 1024 * 1024)
+
+    def _get_results(self):
+        """
+        The result cache, only with --cache and unless bypassed with
+        --no-cache, which is kept by the class so that its memory and
+        counters last for the process.
+
+        >>> r = Router()
+        >>> r.setup(['--cache', '--cache-dir', '/tmp/choice', '--cache-size', '1'])
+        >>> r._get_results() is r._get_results()
+        True
+        >>> r.setup(['--cache', '--no-cache'])
+        >>> r._get_results()
+        >>> r.setup([])
+        >>> r._get_results()
+        """
+        if not self.options.cache or self.options.no_cache or self.options.cache_size <= 0:
+            return None
+
+        directory, limit = self.options.cache_dir, self.options.cache_size * 1024 * 1024
+        results = Router._results
+        if not results or (results.disk.directory, results.disk.limit) != (directory, limit):
+            results = Router._results = ResultCache(directory, limit)
+
+        return results
+
+    def _get_configuration(self):
+        """
+        The options that, with the input, decide the result: the sample
+        decides the auto-detected parser as much as the input does.
+
+        >>> r = Router()
+        >>> r.setup(['-m', 'SplitstemMogrifyer', '-f', 'IndexFilter', '-q'])
+        >>> r._get_configuration()
+        ['SplitstemMogrifyer', 'auto 0', 'IndexFilter', True, 'TextWriter']
+        """
+        return [
+            ','.join(self.options.mogrifyers),
+            self.options.parser or 'auto %d' % self.options.sample,
+            ','.join(self.options.filters),
+            self.options.qualify,
+            self.options.writer or 'TextWriter',
+            ]
+
+    def _get_mogrifyer_chain(self):
+        """
+        The mogrifyers in a chain that counts the bytes each one is run
+        over, shown in the stats.
+        """
+        return self.__forname("mogrifyer", 'MogrifyerChain')(self._get_mogrifyers())
 
     def _get_mogrifyers(self):
         for mogrifyer in self.options.mogrifyers:
@@ -385,56 +958,152 @@ tokens: %s
         parser to choose based on how many questions it parses out giving
         extra weight to a uniform distribution of options.
 
+        An auto-detected parser is returned having already parsed the
+        input strings unless it was decided on a --sample of the input,
+        which is told by the second item of the returned tuple.
+
         @param  string  string  The input string for the parsers to parse
-        @return  parser.Parser  The selected parser instantiation
+        @return  tuple  The selected parser instantiation and whether it
+                        has already parsed the input strings
 
         >>> r = Router()
         >>> r.setup(['-p', 'IndexParser'])
         >>> r._get_parser()
-        <...parser.IndexParser object at...
+        (<...parser.IndexParser object at...>, False)
+
+        >>> r = Router()
+        >>> p, parsed = r._get_parser(['''1. One?
+        ... a. yes
+        ... b. no
+        ... 2. Two?
+        ... a. yes
+        ... b. no'''])
+        >>> p, parsed, len(p.questions)
+        (<...parser.IndexParser object at...>, True, 2)
         """
         if self.options.parser:
-            return self.__forname("parser", self.options.parser)()
+            return self.__forname("parser", self.options.parser)(), False
+
+        # with the --sample option we first try to decide on a prefix of
+        # the input, keeping its results in the shash, and only if the
+        # sample is ambiguous do we fall back to running all the parsers
+        # over the whole input.
+        if self.options.sample and sum(len(s) for s in strings) > self.options.sample:
+            self._run_parsers([self._sample(strings)], self.shash)
+            parser = self._select_parser(self.shash)
+            if parser in self.shash and (self.shash[parser].ordered or self.shash[parser].symetrical):
+                return self.__forname("parser", parser)(), False
+
+        parsers = self._run_parsers(strings, self.qhash)
+        parser = self._select_parser(self.qhash)
 
-        # run all the parsers for the input string and load the results
-        # into a hash.
-        for parserclass in ('IndexParser', 'BlockParser', 'ChunkParser', 'QuestParser', 'StemsParser'):
+        if parser in parsers:
+            return parsers[parser], True
+
+        return self.__forname("parser", parser)(), False
+
+    def _run_parsers(self, strings, qhash):
+        """
+        Run all the parsers for the input strings and load the results
+        into the qhash, or the shash for a sample.
+
+        @param  list  strings  The input strings for the parsers to parse
+        @param  dict  qhash  The hash to load the results into
+        @return  dict  The parsed parser instances keyed by class name
+        """
+        parserclasses = ('IndexParser', 'BlockParser', 'ChunkParser', 'QuestParser', 'StemsParser')
+
+        # with the --jobs option the parsers run in a process pool and we
+        # collect their results in the same order as the serial run so the
+        # selection stays deterministic.
+        if self.options.jobs:
+            if not self.pool:
+                self.pool = Pool(min(self.options.jobs, len(parserclasses)))
+
+            results = self.pool.map(_run_parser, [(p, strings) for p in parserclasses])
+
+            parsers = {}
+            for parserclass, parser in zip(parserclasses, results):
+                if parser:
+                    parsers[parserclass] = parser
+                qhash[parserclass] = Questions(parser.questions if parser else [])
+
+            return parsers
+
+        # keep the parsed instances so that the winner does not have to
+        # parse the input again.
+        parsers = {}
+        for parserclass in parserclasses:
             Parser = self.__forname("parser", parserclass)
             try:
-                q = []
+                parsers[parserclass] = Parser()
                 for string in strings:
-                    q.extend(Parser().parse(string).questions)
-                questions = Questions(q)
+                    parsers[parserclass].parse(string)
+                questions = Questions(parsers[parserclass].questions)
             except OverflowError:
                 questions = Questions([])
-            self.qhash[parserclass] = questions
-                
+            qhash[parserclass] = questions
+
+        return parsers
+
+    def _select_parser(self, qhash):
+        """
+        Look at the parser results in the qhash to determine which parser
+        to use.
 
-        # now look at the parser results to determine which one to use.
+        @param  dict  qhash  The parser results
+        @return  string  The selected parser class name
+        """
         # we first look for an ordered QuestParser and then for an ordered
         # ChunkParser otherwise we look for a symetrical QuestParser and
         # then a symetrical ChunkParser and so on.
         if   False: parser = ''
-        elif self.qhash['QuestParser'].length > 1 and self.qhash['QuestParser'].ordered: parser = 'QuestParser'
-        elif self.qhash['ChunkParser'].length > 1 and self.qhash['ChunkParser'].ordered: parser = 'ChunkParser'
-        elif self.qhash['IndexParser'].length > 1 and self.qhash['IndexParser'].ordered: parser = 'IndexParser'
-        elif self.qhash['StemsParser'].length > 1 and self.qhash['StemsParser'].ordered: parser = 'StemsParser'
-        elif self.qhash['BlockParser'].length > 1 and self.qhash['BlockParser'].ordered: parser = 'BlockParser'
-
-        elif self.qhash['QuestParser'].length > 1 and self.qhash['QuestParser'].symetrical: parser = 'QuestParser'
-        elif self.qhash['ChunkParser'].length > 1 and self.qhash['ChunkParser'].symetrical: parser = 'ChunkParser'
-        elif self.qhash['IndexParser'].length > 1 and self.qhash['IndexParser'].symetrical: parser = 'IndexParser'
-        elif self.qhash['StemsParser'].length > 1 and self.qhash['StemsParser'].symetrical: parser = 'StemsParser'
-        elif self.qhash['BlockParser'].length > 1 and self.qhash['BlockParser'].symetrical: parser = 'BlockParser'
-
-        elif self.qhash['QuestParser'].length > 1: parser = 'QuestParser'
-        elif self.qhash['ChunkParser'].length > 1: parser = 'ChunkParser'
-        elif self.qhash['IndexParser'].length > 1: parser = 'IndexParser'
-        elif self.qhash['StemsParser'].length > 1: parser = 'StemsParser'
+        elif qhash['QuestParser'].length > 1 and qhash['QuestParser'].ordered: parser = 'QuestParser'
+        elif qhash['ChunkParser'].length > 1 and qhash['ChunkParser'].ordered: parser = 'ChunkParser'
+        elif qhash['IndexParser'].length > 1 and qhash['IndexParser'].ordered: parser = 'IndexParser'
+        elif qhash['StemsParser'].length > 1 and qhash['StemsParser'].ordered: parser = 'StemsParser'
+        elif qhash['BlockParser'].length > 1 and qhash['BlockParser'].ordered: parser = 'BlockParser'
+
+        elif qhash['QuestParser'].length > 1 and qhash['QuestParser'].symetrical: parser = 'QuestParser'
+        elif qhash['ChunkParser'].length > 1 and qhash['ChunkParser'].symetrical: parser = 'ChunkParser'
+        elif qhash['IndexParser'].length > 1 and qhash['IndexParser'].symetrical: parser = 'IndexParser'
+        elif qhash['StemsParser'].length > 1 and qhash['StemsParser'].symetrical: parser = 'StemsParser'
+        elif qhash['BlockParser'].length > 1 and qhash['BlockParser'].symetrical: parser = 'BlockParser'
+
+        elif qhash['QuestParser'].length > 1: parser = 'QuestParser'
+        elif qhash['ChunkParser'].length > 1: parser = 'ChunkParser'
+        elif qhash['IndexParser'].length > 1: parser = 'IndexParser'
+        elif qhash['StemsParser'].length > 1: parser = 'StemsParser'
         else:
             parser = 'SingleParser'
 
-        return self.__forname("parser", parser)()
+        return parser
+
+    def _sample(self, strings):
+        """
+        Return a prefix of the input of at most --sample bytes, cut at a
+        question boundary, for the parsers to be scored on.
+
+        @param  list  strings  The input strings
+        @return  string  The sample
+
+        >>> r = Router()
+        >>> r.setup(['--sample', '24'])
+        >>> r._sample(['1. One?\\na. yes\\n\\n2. Two?\\na. no\\n'])
+        '1. One?\\na. yes'
+        """
+        prefix = ''
+        for string in strings:
+            prefix += string[:self.options.sample - len(prefix)]
+            if len(prefix) >= self.options.sample:
+                break
+
+        inputfile = StringIO(prefix)
+
+        for window in Parser().windows(inputfile, self.options.sample):
+            return window
+
+        return ''
 
     def _get_filters(self):
         for filter in self.options.filters:
@@ -455,6 +1124,16 @@ tokens: %s
         if Writer:
             return Writer()
 
+    def _close_pool(self):
+        """
+        Close the --jobs process pool, which is created once and kept for
+        all the _run_parsers() calls of a load.
+        """
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
     def _exit(self):
         sys.exit()
 
@@ -463,27 +1142,18 @@ tokens: %s
 
     def __forname(self, modname, classname):
         """
-        Returns a class of "classname" from module "modname".
-        reposted by ben snider
-            from http://mail.python.org/pipermail/python-list/2003-March/192221.html
-              on http://www.bensnider.com/2008/02/27/dynamically-import-and-instantiate-python-classes/
+        Returns a class of "classname" from module "modname" thru the
+        process registry.
         """
-        # inject the caller's context in not from our choice module
-        if __name__ != 'router': # choice.router
-            modname = __name__.replace('router', modname) # choice.MODNAME
-
-        try:
-            module = __import__(modname)
-            classobj = getattr(sys.modules[modname], classname)
-            return classobj
-    
-        except AttributeError:
-            raise
+        return registry.get(modname, classname)
 
     def __error(self, errors):
         """
-        Writes errors to standard error
+        Writes errors to standard error, and keeps the result of a run
+        with errors out of the result cache.
         """
+        self.result_key = None
+
         for e in (e for e in errors if e):
             sys.stderr.write(str(e))
             sys.stderr.write(' ')
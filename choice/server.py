@@ -0,0 +1,242 @@
+"""
+The server keeps one warm process, its modules imported, its argument
+parser built and its regexes compiled, and answers parse requests over
+localhost HTTP or a Unix socket so that a client does not have to start a
+new choice_app for each document.
+
+A request is an HTTP POST of a JSON object with the router options, as on
+the command-line, and either the input text or the path of an input file::
+
+    {"options": ["-p", "IndexParser", "-w", "JsonWriter"], "path": "input/reading"}
+    {"options": ["-f", "IndexFilter"], "input": "1. Stem?\\na. one\\nb. two"}
+
+and the response body is the writer output.
+"""
+import os
+import sys
+import json
+import socket
+import httplib
+import SocketServer
+import BaseHTTPServer
+
+from StringIO import StringIO
+
+from router import Router
+
+########################################################################
+def parse(options, input=None, path=None):
+    """
+    Run the input text, or input file, thru a router with the options and
+    return the writer output.
+
+    @param  list  options  The router command-line options
+    @param  string  input  The input text
+    @param  string  path  The input file path
+    @return  tuple  The writer output and its file extension
+
+    >>> parse(['-p', 'IndexParser'], '1. Stem?\\na. one\\nb. two')
+    ('1. Stem?\\na. one\\nb. two\\n\\n', '')
+    >>> parse(['-o', 'out.txt'], 'Stem')
+    Traceback (most recent call last):
+    ValueError: option -o is not allowed
+    >>> parse(['--no-cache'], '-o/tmp/out.txt')
+    ('-o/tmp/out.txt\\n\\n', '')
+    """
+    for option in options:
+        if _disallowed(option):
+            raise ValueError, 'option %s is not allowed' % option
+
+    if (input is None) == (path is None):
+        raise ValueError, 'one of input or path is required'
+
+    router = Router()
+    try:
+        router.setup(list(options))
+    except SystemExit:
+        raise ValueError, 'bad options %s' % ' '.join(options)
+
+    if router.options.stats:
+        raise ValueError, 'option -s is not allowed'
+
+    if router.options.input:
+        raise ValueError, 'the input is not allowed in the options'
+
+    # the client input is never parsed as options
+    if path:
+        router.options.inputfile = open(path, 'rU')
+    else:
+        router.options.input = input
+
+    try:
+        router._load()
+        output = StringIO()
+        router.options.outputfile = output
+        router.write()
+    finally:
+        if path:
+            router.options.inputfile.close()
+
+    return output.getvalue(), router._get_writer().extension
+
+def _disallowed(option):
+    """
+    Whether the option is one that the server owns, as a short option with
+    its value attached or as a long option abbreviation.
+
+    >>> [_disallowed(o) for o in ('-ofile', '--out=x', '--stat', '--sample', '-p', 'text')]
+    [True, False, True, False, False, False]
+    """
+    if option.startswith('--'):
+        name = option.split('=')[0]
+        return any(d.startswith(name) for d in Handler.disallowed if d.startswith('--'))
+
+    return option[:2] in Handler.disallowed
+
+########################################################################
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    The handler answers a POST of a parse request with the writer output.
+    """
+    # the server owns the standard streams and the files, and the state and
+    # cache files which it writes and unpickles
+    disallowed = (
+        '-i', '-o', '-s', '--stats', '-V', '--version', '-h', '--help',
+        '--incremental', '--cache', '--cache-dir', '--cache-size',
+        )
+
+    types = {'.json': 'application/json', '.jsonl': 'application/x-ndjson', '.chq': 'application/octet-stream'}
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))
+            output, extension = parse(
+                [str(o) for o in request.get('options', [])],
+                request.get('input', '').encode('utf-8') if 'input' in request else None,
+                request.get('path'),
+                )
+
+        except (ValueError, TypeError, AttributeError, EnvironmentError), e:
+            self.send_error(400, str(e))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', self.types.get(extension, 'text/plain'))
+        self.send_header('Content-Length', str(len(output)))
+        self.end_headers()
+        self.wfile.write(output)
+
+    def log_message(self, format, *args):
+        # a Unix socket client has no address
+        if self.server.verbose:
+            sys.stderr.write('%s - - [%s] %s\n' % (
+                self.client_address[0] if self.client_address else 'unix',
+                self.log_date_time_string(),
+                format % args,
+                ))
+
+########################################################################
+class HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    The HTTP server handles each client in its own thread.
+    """
+    daemon_threads = True
+    verbose = True
+
+class UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    The Unix socket server handles each client in its own thread.
+    """
+    daemon_threads = True
+    verbose = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        SocketServer.UnixStreamServer.server_bind(self)
+
+def server(address, verbose=True, public=False):
+    """
+    The server for the address, a Unix socket path if it has a slash, else
+    a localhost port or host:port.  The host must be a loopback address
+    unless the server is made public.
+
+    @param  string  address  The socket path, or the [host:]port
+    @param  bool  verbose  Log each request to standard error
+    @param  bool  public  Allow a host that is not a loopback address
+    @return  SocketServer  The bound server
+
+    >>> server('0.0.0.0:8765')
+    Traceback (most recent call last):
+    ValueError: 0.0.0.0 is not a loopback address, the server is not public
+    """
+    if '/' in address:
+        s = UnixServer(address, Handler)
+    else:
+        host, port = address.rsplit(':', 1) if ':' in address else ('localhost', address)
+        if not public and not _loopback(host):
+            raise ValueError, '%s is not a loopback address, the server is not public' % host
+        s = HTTPServer((host, int(port)), Handler)
+
+    s.verbose = verbose
+    return s
+
+def _loopback(host):
+    """
+    Whether the host is a loopback address.
+
+    >>> [_loopback(h) for h in ('localhost', '127.0.0.1', '::1', '', '0.0.0.0')]
+    [True, True, True, False, False]
+    """
+    if host in ('::1', '[::1]'):
+        return True
+
+    try:
+        return bool(host) and socket.gethostbyname(host).startswith('127.')
+    except socket.error:
+        return False
+
+########################################################################
+class UnixConnection(httplib.HTTPConnection):
+    """
+    The HTTP connection over a Unix socket.
+    """
+    def __init__(self, path):
+        httplib.HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+def request(address, options, input=None, path=None):
+    """
+    Send a parse request to a server.
+
+    @param  string  address  The server socket path, or the [host:]port
+    @param  list  options  The router command-line options
+    @param  string  input  The input text
+    @param  string  path  The input file path
+    @return  string  The writer output
+    """
+    if '/' in address:
+        connection = UnixConnection(address)
+    else:
+        host, port = address.rsplit(':', 1) if ':' in address else ('localhost', address)
+        connection = httplib.HTTPConnection(host, int(port))
+
+    body = {'options': options}
+    if input is not None:
+        body['input'] = input
+    if path is not None:
+        body['path'] = os.path.abspath(path)
+
+    connection.request('POST', '/parse', json.dumps(body), {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    output = response.read()
+    connection.close()
+
+    if response.status != 200:
+        raise ValueError, 'The server answered %d %s' % (response.status, response.reason)
+
+    return output
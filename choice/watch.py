@@ -0,0 +1,160 @@
+"""
+The watcher keeps track of the input files in a state file so that only
+the files that are new or changed since they were last run, also across
+restarts, are run thru the router again.
+"""
+import os
+import time
+import cPickle
+import hashlib
+import tempfile
+
+########################################################################
+class Watcher(object):
+    """
+    A file has changed if its size or modification time is not the one
+    recorded and neither is the digest of its content, so that a file that
+    was only touched gets its new time recorded without being run again.
+    The size, time and digest are taken when the file is found changed and
+    recorded when it is done, so that a file written to while it is being
+    run is found changed again on the next poll.
+
+    >>> import shutil
+    >>> d = tempfile.mkdtemp()
+    >>> p = os.path.join(d, 'input')
+    >>> open(p, 'w').write('1. One?')
+    >>> w = Watcher(os.path.join(d, '.state'))
+    >>> w.changed([p]) == [p]
+    True
+    >>> w.done(p, 'result')
+    >>> w.changed([p]), w.result(p)
+    ([], 'result')
+    >>> os.utime(p, (0, 0))
+    >>> w.changed([p])
+    []
+    >>> open(p, 'w').write('1. Two?')
+    >>> Watcher(os.path.join(d, '.state')).changed([p]) == [p]
+    True
+    >>> w.changed([p]) == [p]
+    True
+    >>> w.failed(p)
+    >>> w.changed([p]) == [p], w.result(p)
+    (True, 'result')
+    >>> shutil.rmtree(d)
+    """
+    version = 1
+
+    def __init__(self, statepath):
+        self.statepath = statepath
+        self.files     = {}
+        self.pending   = {}
+
+        try:
+            with open(statepath, 'rb') as statefile:
+                state = cPickle.load(statefile)
+            if state.get('version') == self.version:
+                self.files = state['files']
+
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            pass
+
+    def changed(self, paths):
+        """
+        The new and changed files of the paths, in the same order.  The
+        files no longer in the paths are forgotten.
+
+        @param  list  paths  The input file paths
+        @return  list  The new and changed file paths
+        """
+        paths = [os.path.abspath(p) for p in paths]
+        for path in set(self.files) - set(paths):
+            del self.files[path]
+
+        changed = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError: # removed since it was listed
+                continue
+
+            size, mtime, digest, result = self.files.get(path, (None, None, None, None))
+            if (stat.st_size, stat.st_mtime) == (size, mtime):
+                continue
+
+            newdigest = self.digest(path)
+            if newdigest == digest:
+                self.files[path] = (stat.st_size, stat.st_mtime, digest, result)
+                continue
+
+            self.pending[path] = (stat.st_size, stat.st_mtime, newdigest)
+            changed.append(path)
+
+        return changed
+
+    def done(self, path, result=None):
+        """
+        Record a changed file as run and save the state.
+
+        @param  string  path  The input file path
+        @param  object  result  What the run gave, kept for result()
+        """
+        path = os.path.abspath(path)
+        size, mtime, digest = self.pending.pop(path)
+        self.files[path] = (size, mtime, digest, result)
+        self.save()
+
+    def failed(self, path):
+        """
+        Forget a changed file whose run failed, leaving what was recorded
+        before, so that it is found changed and run again on the next poll.
+
+        @param  string  path  The input file path
+        """
+        self.pending.pop(os.path.abspath(path), None)
+
+    def result(self, path):
+        """
+        @param  string  path  The input file path
+        @return  object  The result recorded by done(), None if there is none
+        """
+        return self.files.get(os.path.abspath(path), (None, None, None, None))[3]
+
+    def poll(self, inputs, interval=1.0):
+        """
+        Yield the new and changed files of the inputs every interval
+        seconds, the first time even if there are none and after that only
+        when there are some.
+
+        @param  function  inputs  Returns the input file paths
+        @param  float  interval  The seconds between polls
+        @return  generator  The lists of new and changed file paths
+        """
+        yield self.changed(inputs())
+        while True:
+            time.sleep(interval)
+            changed = self.changed(inputs())
+            if changed:
+                yield changed
+
+    def digest(self, path):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as inputfile:
+            for block in iter(lambda: inputfile.read(1 << 20), ''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    def save(self):
+        """
+        Write the state to a temporary file moved into place so that an
+        interrupted run never leaves half a state.
+        """
+        directory = os.path.dirname(os.path.abspath(self.statepath))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        statefile = tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False)
+        with statefile:
+            cPickle.dump({'version': self.version, 'files': self.files}, statefile, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(statefile.name, self.statepath)
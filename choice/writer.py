@@ -1,7 +1,11 @@
 
+import os
 import json
+import mmap
+import struct
 
 from router import Question
+from question import SpanQuestion
 
 ########################################################################
 class Writer(object):
@@ -109,8 +113,20 @@ class JsonWriter (Writer):
         self.extension = '.json'
 
     def write(self, output, questions):
+        """
+        Write the array one question at a time, flushing each one, so that
+        a question stream is never held in memory as a whole document.
+        """
         super(JsonWriter, self).write()
-        output.write(json.dumps(questions, default=self._serialize))
+
+        output.write('[')
+        separator = ''
+        for question in questions:
+            output.write(separator)
+            output.write(json.dumps(question, default=self._serialize))
+            output.flush()
+            separator = ', '
+        output.write(']')
 
     def _serialize(self, python_object):
         if isinstance(python_object, Question):
@@ -119,3 +135,149 @@ class JsonWriter (Writer):
                 'options': python_object.options,
                 }
         raise TypeError(repr(python_object) + ' is not really JSON serializable')
+
+########################################################################
+class JsonLinesWriter (JsonWriter):
+    """
+    The Json lines writer outputs one Json question object per line.
+
+    >>> import sys
+    >>> from question import Question
+    >>> q = Question()
+    >>> q.stem = '1. What is the JsonLinesWriter?'
+    >>> q.options.append('a. A choice-parser component.')
+    >>> q.options.append('b. A Writer class.')
+    >>> w = JsonLinesWriter()
+    >>> w.write(sys.stdout, [q, q])
+    {"options": ["a. A choice-parser component.", "b. A Writer class."], "stem": "1. What is the JsonLinesWriter?"}
+    {"options": ["a. A choice-parser component.", "b. A Writer class."], "stem": "1. What is the JsonLinesWriter?"}
+    """
+
+    def __init__(self):
+        super(JsonLinesWriter, self).__init__()
+        self.extension = '.jsonl'
+
+    def write(self, output, questions):
+        for question in questions:
+            output.write(json.dumps(question, default=self._serialize))
+            output.write('\n')
+            output.flush()
+
+########################################################################
+class BinaryWriter (Writer):
+    """
+    The binary writer outputs the questions in an offset indexed store for
+    the BinaryReader.  Each question is a record of its part count, the
+    byte length of each part and then the parts, the stem first.  The
+    records are followed by the index of their offsets and a footer with
+    the index offset, the question count and the magic, so the questions
+    can be written as they come even to a pipe.
+
+    >>> import tempfile
+    >>> from question import Question
+    >>> q = Question()
+    >>> q.stem = '1. What is the BinaryWriter?'
+    >>> q.options.append('a. A choice-parser component.')
+    >>> q.options.append('b. A Writer class.')
+    >>> f = tempfile.NamedTemporaryFile()
+    >>> BinaryWriter().write(f, [q, q])
+    >>> f.flush()
+    >>> r = BinaryReader(f.name)
+    >>> len(r), r[1].stem, r[-1].options
+    (2, '1. What is the BinaryWriter?', ['a. A choice-parser component.', 'b. A Writer class.'])
+    >>> r.close()
+    """
+    magic  = 'CHQ1'
+    record = struct.Struct('<I')
+    index  = struct.Struct('<Q')
+    footer = struct.Struct('<QI4s')
+
+    def __init__(self):
+        super(BinaryWriter, self).__init__()
+        self.extension = '.chq'
+
+    def write(self, output, questions):
+        super(BinaryWriter, self).write()
+
+        offsets = []
+        offset = 0
+        for question in questions:
+            parts = [self._encode(question.stem)] + [self._encode(o) for o in question.options]
+            record = ''.join([self.record.pack(len(parts))] + [self.record.pack(len(p)) for p in parts] + parts)
+            output.write(record)
+            offsets.append(offset)
+            offset += len(record)
+
+        output.write(''.join(self.index.pack(o) for o in offsets))
+        output.write(self.footer.pack(offset, len(offsets), self.magic))
+
+    def _encode(self, string):
+        return string.encode('utf-8') if isinstance(string, unicode) else string
+
+########################################################################
+class BinaryReader(object):
+    """
+    The binary reader memory-maps a BinaryWriter store and reads any one
+    question by its number in constant time without loading the rest, the
+    questions being SpanQuestions over the mapped file.  A file that is not
+    a whole store raises a ValueError.
+
+    >>> import tempfile
+    >>> f = tempfile.NamedTemporaryFile()
+    >>> BinaryReader(f.name)
+    Traceback (most recent call last):
+    ValueError: ... is not a question store
+    >>> f.write('CHQ1'); f.flush()
+    >>> BinaryReader(f.name)
+    Traceback (most recent call last):
+    ValueError: ... is not a question store
+    """
+
+    def __init__(self, path):
+        footer = BinaryWriter.footer
+        self.file = open(path, 'rb')
+        self.map  = None
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            if size < footer.size:
+                raise ValueError, '%s is not a question store' % path
+
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.index, self.count, magic = footer.unpack_from(self.map, size - footer.size)
+            if magic != BinaryWriter.magic or self.index + self.count * BinaryWriter.index.size != size - footer.size:
+                raise ValueError, '%s is not a question store' % path
+
+        except (ValueError, EnvironmentError):
+            self.close()
+            raise
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += self.count
+        if not 0 <= number < self.count:
+            raise IndexError, 'question number out of range'
+
+        record = BinaryWriter.record
+        offset, = BinaryWriter.index.unpack_from(self.map, self.index + number * BinaryWriter.index.size)
+        parts, = record.unpack_from(self.map, offset)
+        lengths = struct.unpack_from('<%dI' % parts, self.map, offset + record.size)
+
+        spans = []
+        start = offset + record.size * (parts + 1)
+        for length in lengths:
+            spans.append((start, start + length))
+            start += length
+
+        return SpanQuestion(self.map, spans)
+
+    def __iter__(self):
+        for number in xrange(self.count):
+            yield self[number]
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
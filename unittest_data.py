@@ -1,6 +1,16 @@
+import os
+import re
+import json
+import shutil
+import threading
+import tempfile
 import unittest
 
 from choice.router import Router
+from choice.batch import Batch
+from choice import server
+from choice.parser import Parser
+from choice.parser import QuestParser
 
 class TestChoiceData(unittest.TestCase):
 
@@ -18,10 +28,156 @@ class TestChoiceData(unittest.TestCase):
         self.router.load(['-i', 'input/drivers'])
         self.assertEqual(len(self.router.questions), 11)
 
+    def test_drivers_options(self):
+        self.router.load('-i input/drivers -p ChunkParser'.split())
+        self.assertEqual([len(q.options) for q in self.router.questions], [4] * 11)
+        self.assertEqual(self.router.questions[0].options[3],
+            'd) Nobody is at fault, the accident happened because of an unfortunate combination of things')
+
     def test_reading(self):
         self.router.load(['-i', 'input/reading'])
         self.assertEqual(len(self.router.questions), 15)
 
+    def test_reading_change(self):
+        self.router.load(['-i', 'input/reading', '--no-cache'])
+        question = self.router.questions[0]
+        question.stem = 'Changed?'
+        question.options.append('e)     other')
+        self.assertEqual(question.stem, 'Changed?')
+        self.assertEqual(len(question.options), 5)
+        self.assertEqual(question.options[-1], 'e)     other')
+
+    def test_reading_stream(self):
+        self.router.load('-i input/reading --stream 2000'.split())
+        self.assertEqual(len(list(self.router.questions)), 15)
+
+    def test_accounting_stream(self):
+        windows = list(Parser().windows(open('input/accounting.txt'), 20000))
+        self.assertEqual(''.join(windows), open('input/accounting.txt').read())
+        for window in windows[1:]:
+            self.assertTrue(re.match(r'[0-9]+\.?\s', window), window[:40])
+
+        self.router.load('-i input/accounting.txt --stream 20000'.split())
+        self.assertTrue(len(list(self.router.questions)) > 0)
+
+    def test_reading_sample(self):
+        # the parser internals are only there when not a result cache hit
+        self.router.load('-i input/reading --sample 1500 --no-cache'.split())
+        self.assertEqual(len(self.router.questions), 15)
+        self.assertEqual(str(self.router.shash['QuestParser']), '2/8/o/s')
+        self.assertEqual(self.router.qhash, {})
+
+    def test_reading_jobs(self):
+        self.router.load('-i input/reading -j 2 --no-cache'.split())
+        self.assertEqual(len(self.router.questions), 15)
+        self.assertEqual(self.router.parser.__class__.__name__, 'QuestParser')
+        self.assertTrue(self.router.parser.tokens)
+        self.assertEqual(self.router.pool, None)
+
+    def test_reading_batch(self):
+        outdir = tempfile.mkdtemp()
+        try:
+            results = Batch('input/reading*', ['-w', 'JsonWriter'], 2, outdir).run()
+            self.assertEqual([r[1:4:2] for r in results], [(15, None)])
+            self.assertTrue(os.path.getsize(os.path.join(outdir, 'reading.choice.json')))
+        finally:
+            shutil.rmtree(outdir)
+
+    def test_reading_batch_jobs(self):
+        outdir = tempfile.mkdtemp()
+        try:
+            results = Batch('input/reading*', ['-j', '2', '--pdf-jobs', '2'], 2, outdir).run()
+            self.assertEqual([r[1:4:2] for r in results], [(15, None)])
+        finally:
+            shutil.rmtree(outdir)
+
+    def test_reading_pipeline(self):
+        outdirs = tempfile.mkdtemp(), tempfile.mkdtemp()
+        try:
+            Batch('input/reading*', ['-w', 'JsonWriter'], 2, outdirs[0]).run()
+            results = Batch('input/reading*', ['-w', 'JsonWriter'], 2, outdirs[1], converters=2).run()
+            self.assertEqual([r[1:4:2] for r in results], [(15, None)])
+            outputs = [open(os.path.join(d, 'reading.choice.json')).read() for d in outdirs]
+            self.assertEqual(outputs[0], outputs[1])
+        finally:
+            for outdir in outdirs:
+                shutil.rmtree(outdir)
+
+    def test_reading_pipeline_crlf(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            inputpath = os.path.join(tempdir, 'reading')
+            with open(inputpath, 'wb') as inputfile:
+                inputfile.write(open('input/reading').read().replace('\n', '\r\n'))
+            outputs = []
+            for converters in (None, 2):
+                Batch(inputpath, ['-w', 'JsonWriter', '--no-cache'], 2, tempdir, converters=converters).run()
+                outputs.append(open(os.path.join(tempdir, 'reading.choice.json')).read())
+            self.assertEqual(outputs[0], outputs[1])
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_reading_results(self):
+        cachedir = tempfile.mkdtemp()
+        try:
+            outputs = []
+            for i in range(2):
+                router = Router()
+                router.setup(['-i', 'input/reading', '-w', 'JsonWriter', '--cache', '--cache-dir', cachedir])
+                router._load()
+                router.options.outputfile = tempfile.TemporaryFile()
+                router.write()
+                router.options.outputfile.seek(0)
+                outputs.append(router.options.outputfile.read())
+                self.assertEqual(len(router.questions), 15)
+
+            self.assertEqual((router._results.hits, router._results.misses), (1, 1))
+            self.assertEqual(outputs[0], outputs[1])
+
+            # without --cache the results are neither read nor written
+            router = Router()
+            router.load(['-i', 'input/reading', '--cache-dir', cachedir, '-p', 'IndexParser'])
+            self.assertEqual(len([n for n in os.listdir(cachedir) if n.endswith('.result')]), 1)
+        finally:
+            shutil.rmtree(cachedir)
+
+    def test_reading_incremental(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            inputpath = os.path.join(tempdir, 'reading')
+            statepath = os.path.join(tempdir, 'reading.state')
+            text = open('input/reading').read()
+            for edit in (text, text, text.replace('parental guidance', 'family guidance')):
+                with open(inputpath, 'w') as inputfile:
+                    inputfile.write(edit)
+                router = Router()
+                router.load(['-i', inputpath, '--no-cache', '--incremental', statepath])
+                full = Router()
+                full.load(['-i', inputpath, '--no-cache'])
+                self.assertEqual([(q.stem, q.options) for q in router.questions], [(q.stem, q.options) for q in full.questions])
+
+            self.assertEqual(router.incremental, (1, 15))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_incremental_blocks(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            inputpath = os.path.join(tempdir, 'questions')
+            statepath = os.path.join(tempdir, 'questions.state')
+            text = ''.join('%d. Question %d?\na. yes\nb. no\nc. maybe\n\n' % (i, i) for i in range(1, 7))
+            for edit in (text, text.replace('maybe\n\n2.', 'maybe\n2.'), text):
+                with open(inputpath, 'w') as inputfile:
+                    inputfile.write(edit)
+                router = Router()
+                router.load(['-i', inputpath, '--no-cache', '--incremental', statepath])
+                full = Router()
+                full.load(['-i', inputpath, '--no-cache'])
+                self.assertEqual(len(full.questions), 6)
+                self.assertEqual([(q.stem, q.options) for q in router.questions], [(q.stem, q.options) for q in full.questions])
+        finally:
+            shutil.rmtree(tempdir)
+
     def test_writing(self):
         self.router.load(['-i', 'input/writing'])
         self.assertEqual(len(self.router.questions), 10)
@@ -75,9 +231,68 @@ class TestChoiceData(unittest.TestCase):
         self.router.load(['-i', 'input/money.pdf'])
         self.assertEqual(len(self.router.questions), 23)
 
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tempdir, 'choice.sock')
+        self.server = server.server(self.address, verbose=False)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tempdir)
+
+    def test_reading(self):
+        output = server.request(self.address, ['-w', 'JsonWriter'], path='input/reading')
+        self.assertEqual(len(json.loads(output)), 15)
+
+    def test_clients(self):
+        results = []
+        def client():
+            results.append(server.request(self.address, ['-p', 'IndexParser'], input='1. One?\na. yes\nb. no'))
+        clients = [threading.Thread(target=client) for i in range(8)]
+        for c in clients: c.start()
+        for c in clients: c.join()
+        self.assertEqual(results, ['1. One?\na. yes\nb. no\n\n'] * 8)
+
+    def test_disallowed(self):
+        self.assertRaises(ValueError, server.request, self.address, ['-o', 'x'], input='Stem')
+        self.assertRaises(ValueError, server.request, self.address, ['--cache-dir', self.tempdir], input='Stem')
+        self.assertRaises(ValueError, server.request, self.address, ['--incremental', 'x'], input='Stem')
+
+    def test_input_options(self):
+        victim = os.path.join(self.tempdir, 'victim')
+        open(victim, 'w').write('keep')
+        output = server.request(self.address, ['--no-cache'], input='-o' + victim)
+        self.assertEqual(output, '-o%s\n\n' % victim)
+        self.assertEqual(open(victim).read(), 'keep')
+
+class TestQuestScanner(unittest.TestCase):
+
+    def test_input(self):
+        for name in sorted(os.listdir('input')):
+            if name.endswith('.pdf'):
+                continue
+            string = open(os.path.join('input', name)).read()
+
+            regex, scanner = QuestParser(), QuestParser()
+            regex._quest(string)
+            scanner._scan(string)
+            tokens = [t.strip() for t in regex.tokens if t and t.strip()]
+            self.assertEqual(tokens, [t.strip() for t in scanner.tokens if t and t.strip()], name)
+
+            for token in tokens:
+                self.assertEqual(regex._quest_groups(token), scanner._groups(token), name)
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestChoiceData))
+    suite.addTest(unittest.makeSuite(TestServer))
+    suite.addTest(unittest.makeSuite(TestQuestScanner))
     return suite
 
 if __name__ == '__main__':
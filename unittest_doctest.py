@@ -4,8 +4,18 @@ import doctest
 import choice.router as router
 import choice.mogrifyer as mogrifyer
 import choice.parser as parser
+import choice.lexer as lexer
 import choice.filter as filter
 import choice.writer as writer
+import choice.batch as batch
+import choice.corpus as corpus
+import choice.cache as cache
+import choice.pdf as pdf
+import choice.registry as registry
+import choice.server as server
+import choice.pipeline as pipeline
+import choice.incremental as incremental
+import choice.watch as watch
 
 class TestChoiceDoctest(unittest.TestCase):
 
@@ -25,12 +35,42 @@ class TestChoiceDoctest(unittest.TestCase):
     def test_parser(self):
         self.doctest(parser)
 
+    def test_lexer(self):
+        self.doctest(lexer)
+
     def test_filter(self):
         self.doctest(filter)
 
     def test_writer(self):
         self.doctest(writer)
 
+    def test_batch(self):
+        self.doctest(batch)
+
+    def test_corpus(self):
+        self.doctest(corpus)
+
+    def test_cache(self):
+        self.doctest(cache)
+
+    def test_pdf(self):
+        self.doctest(pdf)
+
+    def test_registry(self):
+        self.doctest(registry)
+
+    def test_server(self):
+        self.doctest(server)
+
+    def test_pipeline(self):
+        self.doctest(pipeline)
+
+    def test_incremental(self):
+        self.doctest(incremental)
+
+    def test_watch(self):
+        self.doctest(watch)
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestChoiceDoctest))